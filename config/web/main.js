@@ -162,6 +162,22 @@ function init() {
     updateUI();
     initScrollSpy();
     initReveal();
+    loadStats();
+}
+
+function loadStats() {
+    fetch(`${BASE_URL}/stats.json`, { cache: 'no-cache' })
+        .then(res => res.ok ? res.json() : Promise.reject(res.status))
+        .then(stats => {
+            document.getElementById('stat-max-speed').innerText = stats.max_speed;
+            document.getElementById('stat-proxy-count').innerText = stats.proxy_count;
+            document.getElementById('stat-updated').innerText = `${stats.updated} MSK`;
+            const countries = Object.entries(stats.countries || {}).sort((a, b) => b[1] - a[1]);
+            document.getElementById('stat-countries').innerText = countries.length
+                ? countries.slice(0, 5).map(([cc, count]) => `${cc} ${count}`).join(', ') + (countries.length > 5 ? ` +${countries.length - 5}` : '')
+                : '—';
+        })
+        .catch(() => {});
 }
 
 function switchPlatform(platform) {
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from typing import List, Set
+from loguru import logger
+
+from core.models import ProxyNode
+
+CHECKPOINT_PATH = "data/checkpoint.jsonl"
+
+
+class Checkpoint:
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self.done_ids: Set[str] = set()
+        self.alive: List[ProxyNode] = []
+
+    @classmethod
+    def open(cls, path: str = CHECKPOINT_PATH, resume: bool = False) -> "Checkpoint":
+        checkpoint = cls(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if not resume:
+            open(path, "w").close()
+            return checkpoint
+
+        if not os.path.exists(path):
+            logger.warning(f"⟲ Журнал {path} не найден, старт с нуля")
+            return checkpoint
+
+        alive = {}
+        batches = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                checkpoint.done_ids.update(entry.get("done", []))
+                for raw in entry.get("alive", []):
+                    node = ProxyNode.model_validate(raw)
+                    alive[node.strict_id] = node
+                batches += 1
+        checkpoint.alive = list(alive.values())
+        logger.info(f"⟲ Возобновление: {batches} батчей из журнала, {len(checkpoint.done_ids)} узлов проверено, {len(checkpoint.alive)} живых")
+        return checkpoint
+
+    def record_batch(self, nodes: List[ProxyNode], alive: List[ProxyNode]):
+        entry = {
+            "t": round(time.time(), 1),
+            "done": [n.strict_id for n in nodes],
+            "alive": [n.model_dump() for n in alive],
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error(f"Ошибка записи журнала {self.path}: {e}")
+
+    def clear(self):
+        if os.path.exists(self.path):
+            try: os.remove(self.path)
+            except Exception: pass
@@ -0,0 +1,164 @@
+import os
+import time
+from typing import List
+from loguru import logger
+
+from core.settings import CONFIG
+
+FDS_PER_NODE = 4
+FD_RESERVE = 256
+
+
+def sample_process(pid: int) -> dict:
+    sample = {}
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:") or line.startswith("VmRSS:"):
+                    key = "rss_peak_mb" if line.startswith("VmHWM:") else "rss_mb"
+                    sample[key] = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        sample["cpu_sec"] = (int(fields[11]) + int(fields[12])) / ticks
+    except Exception:
+        pass
+    return sample
+
+
+def _mem_available_mb() -> float:
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    return 0.0
+
+
+def fd_limit() -> int:
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and hard != resource.RLIM_INFINITY and soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        return soft if soft != resource.RLIM_INFINITY else 1 << 20
+    except Exception:
+        return 1024
+
+
+class AdaptiveController:
+    def __init__(self):
+        cfg = CONFIG.adaptive
+        self.enabled = bool(cfg.get("enabled", True))
+        self.min_batch = int(cfg.get("min_batch_size", 25))
+        self.max_batch = int(cfg.get("max_batch_size", 250))
+        self.min_concurrency = int(cfg.get("min_concurrency", 2))
+        self.max_concurrency = int(cfg.get("max_concurrency", 12))
+        self.target_batch_time = float(cfg.get("target_batch_time", 60.0))
+        self.window = int(cfg.get("window", 3))
+
+        self.cpus = os.cpu_count() or 2
+        self.fd_limit = fd_limit()
+        self.batch_size = self._clamp(CONFIG.BATCH_SIZE, self.min_batch, self.max_batch)
+        initial = cfg.get("initial_concurrency") or self.cpus + 1
+        self.concurrency = self._clamp(initial, self.min_concurrency, self.max_concurrency)
+        if not self.enabled:
+            self.concurrency = int(cfg.get("initial_concurrency") or 5)
+
+        self.rss_ema = 0.0
+        self._direction = 1
+        self._window_reports: List[dict] = []
+        self._window_started = time.monotonic()
+        self._last_throughput = 0.0
+
+        self._apply_limits("старт")
+        logger.info(
+            f"⚙ Контроллер: CPU={self.cpus}, nofile={self.fd_limit}, RAM≈{_mem_available_mb():.0f}MB → "
+            f"батч {self.batch_size}, параллельно {self.concurrency}{'' if self.enabled else ' (адаптация выключена)'}"
+        )
+
+    @staticmethod
+    def _clamp(value, low, high) -> int:
+        return int(max(low, min(high, value)))
+
+    def _decide(self, batch_size: int, concurrency: int, reason: str):
+        batch_size = self._clamp(batch_size, self.min_batch, self.max_batch)
+        concurrency = self._clamp(concurrency, self.min_concurrency, self.max_concurrency)
+        if batch_size == self.batch_size and concurrency == self.concurrency:
+            return
+        logger.info(
+            f"   ⚙ Контроллер: батч {self.batch_size}→{batch_size}, "
+            f"параллельно {self.concurrency}→{concurrency} ({reason})"
+        )
+        self.batch_size, self.concurrency = batch_size, concurrency
+
+    def _apply_limits(self, reason: str):
+        fd_cap = max((self.fd_limit - FD_RESERVE) // (FDS_PER_NODE * max(self.batch_size, 1)), 1)
+        concurrency = min(self.concurrency, fd_cap)
+
+        mem = _mem_available_mb()
+        if self.rss_ema > 0 and mem > 0:
+            mem_cap = max(int(mem * 0.7 / self.rss_ema), 1)
+            concurrency = min(concurrency, mem_cap)
+
+        if concurrency != self.concurrency:
+            self._decide(self.batch_size, concurrency, f"лимиты fd/RAM, {reason}")
+
+    def observe(self, report: dict):
+        if not self.enabled:
+            return
+
+        duration = report.get("duration", 0.0)
+        size = max(report.get("size", 1), 1)
+        rss = report.get("rss_peak_mb", 0.0)
+        if rss:
+            self.rss_ema = rss if not self.rss_ema else 0.7 * self.rss_ema + 0.3 * rss
+
+        logger.debug(
+            f"Контроллер: батч {size} за {duration:.1f}s, живых {report.get('alive', 0)}, "
+            f"старт sing-box {report.get('startup', 0.0) * 1000:.0f}мс, RSS {rss:.0f}MB, CPU {report.get('cpu_sec', 0.0):.1f}s, "
+            f"таймаут={report.get('timed_out', False)}"
+        )
+
+        if report.get("timed_out") or report.get("failed"):
+            self._decide(int(self.batch_size * 0.75), self.concurrency, "таймаут/сбой батча")
+            self._reset_window()
+            return
+
+        try:
+            load = os.getloadavg()[0] / self.cpus
+        except OSError:
+            load = 0.0
+        if load > 1.5:
+            self._decide(self.batch_size, self.concurrency - 1, f"load/CPU {load:.2f}")
+            self._reset_window()
+            return
+
+        if duration > 0:
+            ratio = self.target_batch_time / duration
+            base = self.batch_size if ratio >= 1 else size
+            scaled = int(base * max(0.75, min(1.25, ratio)))
+            if abs(scaled - self.batch_size) >= max(self.batch_size // 10, 1):
+                self._decide(scaled, self.concurrency, f"батч {duration:.0f}s при цели {self.target_batch_time:.0f}s")
+
+        self._window_reports.append(report)
+        if len(self._window_reports) >= self.window:
+            elapsed = max(time.monotonic() - self._window_started, 0.1)
+            throughput = sum(r.get("size", 0) for r in self._window_reports) / elapsed
+            if self._last_throughput and throughput < self._last_throughput:
+                self._direction = -self._direction
+            self._decide(
+                self.batch_size, self.concurrency + self._direction,
+                f"пропускная способность {throughput:.1f} узл/с (было {self._last_throughput:.1f})"
+            )
+            self._last_throughput = throughput
+            self._reset_window()
+
+        self._apply_limits("после батча")
+
+    def _reset_window(self):
+        self._window_reports = []
+        self._window_started = time.monotonic()
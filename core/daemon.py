@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from aiohttp import web
+from loguru import logger
+
+from core.settings import CONFIG
+from core.models import ProxyNode
+from core.parser import LinkParser
+from core.engine import BatchEngine
+from core.controller import AdaptiveController
+from core.exporter import Exporter, TIERS_DIR
+from core.history import RunHistory
+from core.metrics import METRICS
+
+RETRY_DELAY = 60.0
+
+ROUTES = {
+    "/sub": "sub_all.txt",
+    "/sub1": "sub_bs.txt",
+    "/sub2": "sub_chs.txt",
+}
+
+
+class ServeDaemon:
+    def __init__(self, history: Optional[RunHistory] = None):
+        cfg = CONFIG.serve
+        self.source_interval = float(cfg.get("source_interval", 3600))
+        self.source_intervals: Dict[str, float] = {k: float(v) for k, v in (cfg.get("source_intervals") or {}).items()}
+        self.alive_recheck = float(cfg.get("alive_recheck", 1200))
+        self.dead_recheck = float(cfg.get("dead_recheck", 7200))
+        self.tick = float(cfg.get("tick", 5))
+
+        self.engine = BatchEngine()
+        self.controller = AdaptiveController()
+        self.history = history or RunHistory()
+
+        self.nodes: Dict[str, ProxyNode] = {}
+        self.alive: Dict[str, ProxyNode] = {}
+        self.checked_at: Dict[str, float] = {}
+        self.in_flight: Set[str] = set()
+        self.source_nodes: Dict[str, Set[str]] = {}
+        self.source_due: Dict[str, float] = {}
+
+        self.documents: Dict[str, Tuple[bytes, bytes, str]] = {}
+        self._dirty = True
+        self._batch_num = 0
+        self._stop = asyncio.Event()
+
+    def _interval_for(self, url: str) -> float:
+        return self.source_intervals.get(url, self.source_interval)
+
+    async def _refresh_source(self, url: str):
+        parser = LinkParser()
+        fresh = await parser.fetch_and_parse([url])
+        status = parser.metrics.get(url, {}).get("status", "?")
+        if status != "OK" and url in self.source_nodes:
+            logger.warning(f"⟳ {url}: {status}, оставляю {len(self.source_nodes[url])} узлов до следующей попытки")
+            return
+
+        ids = set()
+        added = changed = 0
+        for node in fresh:
+            ids.add(node.strict_id)
+            known = self.nodes.get(node.strict_id)
+            if known is None:
+                self.nodes[node.strict_id] = node
+                added += 1
+            elif known.raw_uri != node.raw_uri:
+                self.nodes[node.strict_id] = node
+                if known.config == node.config:
+                    continue
+                BatchEngine.forget(node.strict_id)
+                self.checked_at.pop(node.strict_id, None)
+                if self.alive.pop(node.strict_id, None):
+                    self._dirty = True
+                changed += 1
+
+        gone = self.source_nodes.get(url, set()) - ids
+        self.source_nodes[url] = ids
+        still_listed = set().union(*self.source_nodes.values())
+        for sid in gone - still_listed:
+            self.nodes.pop(sid, None)
+            BatchEngine.forget(sid)
+            self.checked_at.pop(sid, None)
+            if self.alive.pop(sid, None):
+                self._dirty = True
+
+        logger.info(f"⟳ Источник обновлён: {len(ids)} узлов (новых {added}, изменено {changed}, ушло {len(gone)}), следующий через {self._interval_for(url):.0f}s")
+
+    async def _source_loop(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            refreshed = False
+            for url in LinkParser.source_list():
+                if self.source_due.get(url, 0.0) <= now:
+                    self.source_due[url] = now + self._interval_for(url)
+                    refreshed = True
+                    try:
+                        await self._refresh_source(url)
+                    except Exception as e:
+                        logger.error(f"Ошибка обновления источника: {e}")
+            if refreshed:
+                BatchEngine.retain(list(self.nodes.values()))
+                self.history.save()
+            await self._sleep(self.tick)
+
+    def _current(self, node: ProxyNode) -> bool:
+        known = self.nodes.get(node.strict_id)
+        return known is not None and known.config == node.config
+
+    def _due_nodes(self) -> List[ProxyNode]:
+        now = time.monotonic()
+        due = []
+        for sid, node in self.nodes.items():
+            if sid in self.in_flight:
+                continue
+            checked = self.checked_at.get(sid)
+            interval = self.alive_recheck if sid in self.alive else self.dead_recheck
+            if checked is None or now - checked >= interval:
+                due.append((checked is not None, checked or 0.0, node))
+        due.sort(key=lambda d: d[:2])
+        return [d[2] for d in due]
+
+    async def _check_batch(self, batch: List[ProxyNode]):
+        self._batch_num += 1
+        report = {"size": len(batch)}
+        t0 = time.monotonic()
+        try:
+            results = await self.engine.check_batch(batch, batch_num=self._batch_num, report=report)
+        except Exception as e:
+            logger.error(f"Сбой батча {self._batch_num}: {e}")
+            results = []
+            report["failed"] = True
+        report["duration"] = time.monotonic() - t0
+        report["alive"] = len(results)
+        self.controller.observe(report)
+        METRICS.observe("batch_seconds", report["duration"])
+
+        self.in_flight.difference_update(n.strict_id for n in batch)
+        now = time.monotonic()
+        alive_ids = {n.strict_id for n in results}
+        unfinished = set()
+        if report.get("failed") or report.get("timed_out"):
+            unfinished = {n.strict_id for n in batch} - alive_ids
+            logger.warning(f"Батч {self._batch_num} не завершён, повтор {len(unfinished)} узлов через {RETRY_DELAY:.0f}s")
+            for sid in unfinished & set(self.nodes):
+                interval = self.alive_recheck if sid in self.alive else self.dead_recheck
+                self.checked_at[sid] = now - interval + RETRY_DELAY
+
+        for node in batch:
+            if not self._current(node) or node.strict_id in unfinished:
+                continue
+            self.checked_at[node.strict_id] = now
+            if node.strict_id not in alive_ids and self.alive.pop(node.strict_id, None):
+                self._dirty = True
+        for node in results:
+            if self._current(node):
+                self.alive[node.strict_id] = node
+                self._dirty = True
+
+        self.history.record_run([n.strict_id for n in batch if n.strict_id not in unfinished], results, {})
+        logger.info(f"   ✧ Батч {self._batch_num}: живых {len(results)}/{len(batch)}, всего в раздаче {len(self.alive)}/{len(self.nodes)}")
+
+    async def _check_loop(self):
+        running: Set[asyncio.Task] = set()
+        while not self._stop.is_set():
+            while len(running) < self.controller.concurrency:
+                due = self._due_nodes()
+                if not due:
+                    break
+                batch = due[:self.controller.batch_size]
+                self.in_flight.update(n.strict_id for n in batch)
+                task = asyncio.create_task(self._check_batch(batch))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            if self._dirty:
+                self._render()
+            await self._sleep(self.tick)
+
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    def _render(self):
+        self._dirty = False
+        if not self.alive:
+            return
+        entries = Exporter.build_entries(list(self.alive.values()))
+        outputs = Exporter.default_outputs() + [factory() for factory in Exporter.OUTPUT_PLUGINS]
+        for entry in entries:
+            for output in outputs:
+                output.feed(entry)
+
+        documents = {}
+        for output in outputs:
+            for filename, content in output.files():
+                data = content.encode("utf-8")
+                etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+                documents[filename] = (data, gzip.compress(data, mtime=0), etag)
+        self.documents = documents
+        METRICS.set("alive_nodes", len(self.alive))
+
+    def _document_for(self, path: str) -> Optional[str]:
+        if path in ROUTES:
+            return ROUTES[path]
+        if path.startswith("/sub/"):
+            return f"{TIERS_DIR}/{path[len('/sub/'):].lower()}.txt"
+        return None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        name = self._document_for(request.path)
+        doc = self.documents.get(name or "")
+        if doc is None:
+            if name in ROUTES.values() and not self.documents:
+                raise web.HTTPServiceUnavailable(headers={"Retry-After": "60"})
+            raise web.HTTPNotFound()
+
+        data, gz, etag = doc
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=0, must-revalidate",
+            "Vary": "Accept-Encoding",
+        }
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            data = gz
+        return web.Response(body=data, headers=headers, content_type="text/plain", charset="utf-8")
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        METRICS.set("known_nodes", len(self.nodes))
+        return web.Response(text=METRICS.to_prometheus(), content_type="text/plain")
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self):
+        self._stop.set()
+
+    async def run(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        app.router.add_get("/{tail:.*}", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.success(f"⌁ Демон запущен: http://{host}:{port}/sub, перепроверка живых каждые {self.alive_recheck:.0f}s")
+
+        try:
+            await asyncio.gather(self._source_loop(), self._check_loop())
+        finally:
+            await runner.cleanup()
+            self.history.save()
@@ -9,25 +9,64 @@ import ipaddress
 import aiohttp
 from aiohttp_socks import ProxyConnector
 from loguru import logger
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
 
 from core.models import ProxyNode
 from core.settings import CONFIG
+from core.history import RunHistory
+from core.scheduler import DeadlineScheduler
+from core.controller import AdaptiveController, sample_process
+from core.workers import WorkerPool
+from core.metrics import METRICS
+from core.profiler import PROFILER
+from core.checkpoint import Checkpoint
+from core.trace import RECORDER
 
 CHAMPION_BYTES = 10 * 1024 * 1024
 NORMAL_BYTES = 1 * 1024 * 1024
 CHUNK_SIZE = 65536
 BATCH_HARD_TIMEOUT = 180.0
+GEO_LOOKUP_TIMEOUT = 3.0
+PING_TIMEOUT = 8.0
+SPEED_TIMEOUT = 8.0
+NODE_DEADLINE_MARGIN = 5.0
+CHAMPION_TIMEOUT = 30.0
+CHAMPION_COUNT = 5
+PUBLISH_MARGIN = 20.0
+TRANSIENT_STATUSES = {"timeout", "error", "drop", "deferred", "unfinished"}
+FRAGMENT_CACHE_LIMIT = 50000
+
+CONFIG_HEAD_JSON = json.dumps({
+    "log": {"level": "fatal", "output": "discard"},
+    "dns": {
+        "servers":[{"tag": "remote", "address": "udp://8.8.8.8", "detour": "direct"}],
+        "independent_cache": True,
+    },
+}, separators=(",", ":"))[:-1] + ',"inbounds":['
+DNS_RULE_JSON = json.dumps({"protocol": "dns", "outbound": "direct"}, separators=(",", ":"))
+SERVICE_OUTBOUNDS_JSON =[
+    json.dumps({"type": "direct", "tag": "direct"}, separators=(",", ":")),
+    json.dumps({"type": "block", "tag": "block"}, separators=(",", ":")),
+]
 
 
 class BatchEngine:
     _GEO_CACHE: dict = {}
+    _FRAGMENT_CACHE: dict = {}
+    _VALID_CACHE: dict = {}
+    _PORT_MIN: int = 10000
+    _PORT_MAX: int = 60000
     _PORT_COUNTER: int = 10000
     _PORT_LOCK: Optional[asyncio.Lock] = None
 
     def __init__(self):
         self.ping_semaphore = asyncio.Semaphore(150)
+        self.ping_backend = CONFIG.checking.get("ping_backend", "socks")
+        self.clash_secret = uuid.uuid4().hex
         self.speed_semaphore = asyncio.Semaphore(5) 
+        self.hard_timeout = BATCH_HARD_TIMEOUT
+        self.deadline_margin = NODE_DEADLINE_MARGIN
         logger.info("⚙ Engine готов. Matrix Concurrency Mode (Параллельные батчи + Шахматный пинг). Логи агрегированы.")
 
     @classmethod
@@ -35,14 +74,19 @@ class BatchEngine:
         if cls._PORT_LOCK is None:
             cls._PORT_LOCK = asyncio.Lock()
 
+    @classmethod
+    def configure_ports(cls, low: int, high: int):
+        cls._PORT_MIN, cls._PORT_MAX = low, high
+        cls._PORT_COUNTER = low
+
     @classmethod
     async def _get_next_base_port(cls, batch_size: int) -> int:
         cls._ensure_lock()
         async with cls._PORT_LOCK:
+            if cls._PORT_COUNTER + batch_size + 10 > cls._PORT_MAX:
+                cls._PORT_COUNTER = cls._PORT_MIN
             port = cls._PORT_COUNTER
             cls._PORT_COUNTER += batch_size + 10
-            if cls._PORT_COUNTER > 60000:
-                cls._PORT_COUNTER = 10000
             return port
 
     @staticmethod
@@ -84,45 +128,72 @@ class BatchEngine:
                 return sni
         return None
 
+    @classmethod
+    def _outbound_fragment(cls, node: ProxyNode) -> Optional[str]:
+        key = node.strict_id
+        if key in cls._FRAGMENT_CACHE:
+            return cls._FRAGMENT_CACHE[key]
+
+        fragment = None
+        outbound = cls._node_to_outbound(node, "")
+        if outbound:
+            outbound.pop("tag", None)
+            fragment = json.dumps(outbound, ensure_ascii=False, separators=(",", ":"))
+
+        if len(cls._FRAGMENT_CACHE) >= FRAGMENT_CACHE_LIMIT:
+            cls._FRAGMENT_CACHE.clear()
+        cls._FRAGMENT_CACHE[key] = fragment
+        return fragment
+
+    @classmethod
+    def forget(cls, strict_id: str):
+        cls._FRAGMENT_CACHE.pop(strict_id, None)
+        cls._VALID_CACHE.pop(strict_id, None)
+
+    @classmethod
+    def retain(cls, nodes: List[ProxyNode]):
+        ids = {n.strict_id for n in nodes}
+        servers = {n.config.server for n in nodes}
+        for cache, keep in ((cls._FRAGMENT_CACHE, ids), (cls._VALID_CACHE, ids), (cls._GEO_CACHE, servers)):
+            for key in [k for k in cache if k not in keep]:
+                del cache[key]
+
     @staticmethod
-    def _generate_batch_config(nodes: List[ProxyNode], base_port: int) -> dict:
-        inbounds = []
+    def _generate_batch_config(nodes: List[ProxyNode], base_port: int, clash_secret: Optional[str] = None) -> dict:
+        inbounds =[]
         outbounds =[]
-        rules =[{"protocol": "dns", "outbound": "direct"}]
+        rules =[DNS_RULE_JSON]
+        ports =[]
+        indices =[]
 
         for i, node in enumerate(nodes):
-            tag = f"proxy-{i}"
-            outbound = BatchEngine._node_to_outbound(node, tag)
-            if not outbound: 
+            fragment = BatchEngine._outbound_fragment(node)
+            if not fragment: 
                 continue
             
             local_port = base_port + i
-            inbounds.append({
-                "type": "socks",
-                "tag": f"in-{i}",
-                "listen": "127.0.0.1",
-                "listen_port": local_port,
-            })
-            outbounds.append(outbound)
-            rules.append({"inbound":[f"in-{i}"], "outbound": tag})
-
-        outbounds.append({"type": "direct", "tag": "direct"})
-        outbounds.append({"type": "block", "tag": "block"})
-
-        return {
-            "log": {"level": "fatal", "output": "discard"},
-            "dns": {
-                "servers":[{"tag": "remote", "address": "udp://8.8.8.8", "detour": "direct"}],
-                "independent_cache": True,
-            },
-            "inbounds": inbounds,
-            "outbounds": outbounds,
-            "route": {
-                "rules": rules,
-                "final": "block",
-                "auto_detect_interface": True,
-            },
-        }
+            inbounds.append(f'{{"type":"socks","tag":"in-{i}","listen":"127.0.0.1","listen_port":{local_port}}}')
+            outbounds.append(f'{{"tag":"proxy-{i}",{fragment[1:]}')
+            rules.append(f'{{"inbound":["in-{i}"],"outbound":"proxy-{i}"}}')
+            ports.append(local_port)
+            indices.append(i)
+
+        outbounds.extend(SERVICE_OUTBOUNDS_JSON)
+
+        controller = None
+        experimental = ""
+        if clash_secret:
+            controller = f"127.0.0.1:{base_port + len(nodes)}"
+            clash_api = {"clash_api": {"external_controller": controller, "secret": clash_secret}}
+            experimental = ',"experimental":' + json.dumps(clash_api, separators=(",", ":"))
+
+        text = "".join((
+            CONFIG_HEAD_JSON, ",".join(inbounds),
+            '],"outbounds":[', ",".join(outbounds),
+            '],"route":{"rules":[', ",".join(rules),
+            '],"final":"block","auto_detect_interface":true}', experimental, "}",
+        ))
+        return {"text": text, "ports": ports, "indices": indices, "controller": controller}
 
     @staticmethod
     def _node_to_outbound(node: ProxyNode, tag: str) -> Optional[dict]:
@@ -249,43 +320,136 @@ class BatchEngine:
         except Exception as e:
             return None
 
-    async def _is_config_valid(self, config_data: dict, batch_id: str) -> bool:
-        if not config_data.get("inbounds"): return False
+    @staticmethod
+    def _config_transport() -> str:
+        return CONFIG.checking.get("config_transport", "stdin")
+
+    @staticmethod
+    def _config_dir() -> str:
+        if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+            return "/dev/shm"
+        os.makedirs("data", exist_ok=True)
+        return "data"
+
+    async def _is_config_valid(self, config_data: dict) -> bool:
+        if not config_data["ports"]: return False
             
-        cfg_path = f"data/check_{batch_id}.json"
+        t0 = time.perf_counter()
+        valid = False
+        cfg_path = None
         try:
-            with open(cfg_path, "w") as f:
-                json.dump(config_data, f)
-                
+            if self._config_transport() == "file":
+                cfg_path = os.path.join(self._config_dir(), f"check_{uuid.uuid4().hex[:8]}.json")
+                with open(cfg_path, "w", encoding="utf-8") as f:
+                    f.write(config_data["text"])
+
             proc = await asyncio.create_subprocess_exec(
-                "sing-box", "check", "-c", cfg_path,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                "sing-box", "check", "-c", cfg_path or "stdin",
+                stdin=asyncio.subprocess.DEVNULL if cfg_path else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
             )
-            stdout, stderr = await proc.communicate()
-            return proc.returncode == 0
+            await proc.communicate(None if cfg_path else config_data["text"].encode("utf-8"))
+            valid = proc.returncode == 0
+            return valid
         except Exception:
             return False
         finally:
-            if os.path.exists(cfg_path):
+            METRICS.observe("config_check_seconds", time.perf_counter() - t0)
+            METRICS.inc("config_check_total", result="ok" if valid else "invalid")
+            if cfg_path and os.path.exists(cfg_path):
                 try: os.remove(cfg_path)
                 except Exception: pass
 
     @staticmethod
-    async def _wait_for_port(host: str, port: int, timeout: float = 5.0) -> bool:
-        deadline = time.monotonic() + timeout
+    async def _port_open(host: str, port: int) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), timeout=0.3
+            )
+            writer.close()
+            try: await writer.wait_closed()
+            except Exception: pass
+            return True
+        except (ConnectionRefusedError, OSError, asyncio.TimeoutError):
+            return False
+
+    async def _wait_ready(self, proc, ports: List[int], timeout: float = 8.0) -> Optional[float]:
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        pending = list(ports)
         while time.monotonic() < deadline:
-            try:
-                _, writer = await asyncio.wait_for(
-                    asyncio.open_connection(host, port), timeout=0.3
-                )
-                writer.close()
-                try: await writer.wait_closed()
-                except Exception: pass
-                return True
-            except (ConnectionRefusedError, OSError, asyncio.TimeoutError):
-                await asyncio.sleep(0.1)
-        return False
+            if proc.returncode is not None:
+                return None
+            opened = await asyncio.gather(*[self._port_open("127.0.0.1", p) for p in pending])
+            pending = [p for p, ok in zip(pending, opened) if not ok]
+            if not pending:
+                return time.monotonic() - t0
+            await asyncio.sleep(0.05)
+        return None
+
+    @staticmethod
+    def _connectivity_urls() -> List[str]:
+        return CONFIG.checking.get("connectivity_urls") or["http://www.gstatic.com/generate_204"]
+
+    async def _hedged_probe(self, probe, urls: List[str], budget: float) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        hedge_delay = float(CONFIG.checking.get("hedge_delay", 1.0))
+        pending = {}
+        failures =[]
+        launched = 0
+        try:
+            while True:
+                if launched < len(urls):
+                    pending[asyncio.create_task(probe(urls[launched]))] = urls[launched]
+                    launched += 1
+                if not pending:
+                    break
+                left = deadline - loop.time()
+                if left <= 0:
+                    break
+                wait = min(hedge_delay, left) if launched < len(urls) else left
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = pending.pop(task)
+                    res = task.result() if not task.exception() else {"status": "error"}
+                    if res.get("status") == "ok":
+                        res["endpoint"] = url
+                        return res
+                    failures.append(res)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        statuses = {f.get("status") for f in failures}
+        if pending or "timeout" in statuses:
+            return {"status": "timeout"}
+        if failures and all(f.get("permanent") for f in failures):
+            return {"status": "error", "permanent": True}
+        return {"status": "error"}
+
+    @staticmethod
+    def _ping_result(res: dict, node: ProxyNode, port: int) -> dict:
+        if res.get("status") != "ok":
+            return res
+        if res["latency"] > CONFIG.checking.get("max_latency", 5000):
+            return {"status": "high_latency"}
+        return {"status": "ok", "node": node, "port": port, "latency": res["latency"], "endpoint": res["endpoint"]}
+
+    @staticmethod
+    async def _socks_probe(session: aiohttp.ClientSession, url: str) -> dict:
+        t0 = time.perf_counter()
+        try:
+            ping_timeout = aiohttp.ClientTimeout(total=PING_TIMEOUT, connect=4.0)
+            async with session.get(url, allow_redirects=False, timeout=ping_timeout) as resp:
+                if resp.status not in (200, 204, 301, 302):
+                    return {"status": "error", "permanent": True}
+                return {"status": "ok", "latency": int((time.perf_counter() - t0) * 1000)}
+        except asyncio.TimeoutError:
+            return {"status": "timeout"}
+        except Exception:
+            return {"status": "error"}
 
     async def _ping_phase(self, node: ProxyNode, port: int, delay_sec: float) -> dict:
         if delay_sec > 0:
@@ -293,34 +457,101 @@ class BatchEngine:
             
         connector = ProxyConnector.from_url(f"socks5://127.0.0.1:{port}", rdns=True)
         headers = {"User-Agent": CONFIG.system.get("user_agent", "Mozilla/5.0")}
-        max_latency = CONFIG.checking.get("max_latency", 5000)
 
         try:
             async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
-                connectivity_urls = CONFIG.checking.get("connectivity_urls",["http://www.gstatic.com/generate_204"])
-                target_url = connectivity_urls[0] if connectivity_urls else "http://www.gstatic.com/generate_204"
-
                 async with self.ping_semaphore:
                     t0 = time.perf_counter()
-                    try:
-                        ping_timeout = aiohttp.ClientTimeout(total=8.0, connect=4.0)
-                        async with session.get(target_url, allow_redirects=False, timeout=ping_timeout) as resp:
-                            if resp.status not in (200, 204, 301, 302): 
-                                return {"status": "error"}
-                            latency = int((time.perf_counter() - t0) * 1000)
-                    except asyncio.TimeoutError:
-                        return {"status": "timeout"}
-                    except Exception:
-                        return {"status": "error"}
+                    res = await self._hedged_probe(lambda url: self._socks_probe(session, url), self._connectivity_urls(), PING_TIMEOUT)
+                    return RECORDER.outcome("ping", node, self._ping_result(res, node, port), t0)
+        except Exception:
+            return {"status": "error"}
 
-                if latency > max_latency: 
-                    return {"status": "high_latency"}
-                    
-                return {"status": "ok", "node": node, "port": port, "latency": latency}
+    @staticmethod
+    async def _clash_probe(session: aiohttp.ClientSession, api_base: str, tag: str, url: str) -> dict:
+        params = {"url": url, "timeout": str(int(PING_TIMEOUT * 1000))}
+        try:
+            async with session.get(f"{api_base}/proxies/{tag}/delay", params=params, timeout=aiohttp.ClientTimeout(total=PING_TIMEOUT + 2.0)) as resp:
+                if resp.status in (408, 504):
+                    return {"status": "timeout"}
+                if resp.status != 200:
+                    return {"status": "error"}
+                latency = int((await resp.json()).get("delay", 0))
+        except asyncio.TimeoutError:
+            return {"status": "timeout"}
         except Exception:
             return {"status": "error"}
+        if not latency:
+            return {"status": "error"}
+        return {"status": "ok", "latency": latency}
+
+    async def _clash_ping_phase(self, session: aiohttp.ClientSession, api_base: str, node: ProxyNode, tag: str, port: int) -> dict:
+        async with self.ping_semaphore:
+            t0 = time.perf_counter()
+            res = await self._hedged_probe(lambda url: self._clash_probe(session, api_base, tag, url), self._connectivity_urls(), PING_TIMEOUT + 2.0)
+            return RECORDER.outcome("ping", node, self._ping_result(res, node, port), t0)
+
+    async def _clash_ping_all(self, config_data: dict, nodes: List[ProxyNode], base_port: int) -> list:
+        api_base = "http://" + config_data["controller"]
+        headers = {"Authorization": f"Bearer {self.clash_secret}"}
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            return await asyncio.gather(*[
+                self._clash_ping_phase(session, api_base, nodes[i], f"proxy-{i}", base_port + i)
+                for i in config_data["indices"]
+            ], return_exceptions=True)
 
-    async def _speed_phase(self, node_data: dict, is_champion: bool) -> dict:
+    @staticmethod
+    async def _download(session: aiohttp.ClientSession, urls: List[str], streams: int, target_bytes: int, timeout: aiohttp.ClientTimeout) -> Tuple[str, int, float]:
+        total = 0
+        t_start = time.perf_counter()
+        last_byte = t_start
+        share = target_bytes / max(streams, 1)
+        tasks =[]
+
+        async def stream(url: str) -> str:
+            nonlocal total, last_byte
+            got = 0
+            try:
+                async with session.get(url, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        return "error"
+                    try:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            got += len(chunk)
+                            total += len(chunk)
+                            last_byte = time.perf_counter()
+                            if total >= target_bytes:
+                                for task in tasks:
+                                    if task is not asyncio.current_task():
+                                        task.cancel()
+                                return "ok"
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        return "stall"
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                return "drop"
+            return "ok" if got >= share or total >= target_bytes else "stall"
+
+        tasks.extend(asyncio.create_task(stream(urls[i % len(urls)])) for i in range(streams))
+        try:
+            results =[r if isinstance(r, str) else "ok" for r in await asyncio.gather(*tasks, return_exceptions=True)]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if all(r == "error" for r in results):
+            return "error", total, 0.0
+        if "drop" in results and total < 50000:
+            return "drop", total, 0.0
+        if "drop" in results or "stall" in results:
+            last_byte = time.perf_counter()
+        return "ok", total, max(last_byte - t_start, 0.1)
+
+    async def _speed_phase(self, node_data: dict, is_champion: bool, deadline: Optional[float] = None, streams: int = 0) -> dict:
         node = node_data["node"]
         port = node_data["port"]
         latency = node_data["latency"]
@@ -331,42 +562,30 @@ class BatchEngine:
         
         try:
             async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
-                url = CONFIG.checking.get("champion_test_url" if is_champion else "speedtest_url")
-                dl_timeout = aiohttp.ClientTimeout(total=12.0 if is_champion else 8.0)
-                target_bytes = CHAMPION_BYTES if is_champion else NORMAL_BYTES
+                urls = CONFIG.checking.get("speed_endpoints") or[CONFIG.checking.get("champion_test_url" if is_champion else "speedtest_url")]
+                streams = max(1, streams or int(CONFIG.checking.get("champion_streams" if is_champion else "speed_streams", 1)))
+                dl_timeout = aiohttp.ClientTimeout(total=12.0 if is_champion else SPEED_TIMEOUT)
+                target_bytes = (CHAMPION_BYTES if is_champion else NORMAL_BYTES) * streams
 
                 async with self.speed_semaphore:
+                    if deadline is not None and time.monotonic() + dl_timeout.total + GEO_LOOKUP_TIMEOUT > deadline:
+                        return {"status": "deferred", "node": node}
                     t_start = time.perf_counter()
-                    total = 0
-                    try:
-                        async with session.get(url, timeout=dl_timeout) as resp:
-                            if resp.status != 200: 
-                                return {"status": "error"}
-                            try:
-                                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
-                                    total += len(chunk)
-                                    if total >= target_bytes: break
-                            except Exception: 
-                                pass 
-                    except asyncio.TimeoutError:
-                        if total < 50000:
-                            return {"status": "drop"}
-                    except Exception:
-                        if total < 50000: 
-                            return {"status": "drop"}
+                    status, total, dur = await self._download(session, urls, streams, target_bytes, dl_timeout)
+                    if status != "ok":
+                        return RECORDER.outcome("speed", node, {"status": status}, t_start)
 
-                dur = max(time.perf_counter() - t_start, 0.1)
                 speed = round(min((total * 8) / (dur * 1_000_000), 3000.0), 1)
 
                 if speed < min_speed: 
-                    return {"status": "low_speed"}
+                    return RECORDER.outcome("speed", node, {"status": "low_speed"}, t_start)
 
                 country = "UN"
                 if node.config.server in BatchEngine._GEO_CACHE:
                     country = BatchEngine._GEO_CACHE[node.config.server]
                 else:
                     try:
-                        async with session.get("http://cp.cloudflare.com/cdn-cgi/trace", timeout=aiohttp.ClientTimeout(total=3.0)) as geo:
+                        async with session.get("http://cp.cloudflare.com/cdn-cgi/trace", timeout=aiohttp.ClientTimeout(total=GEO_LOOKUP_TIMEOUT)) as geo:
                             if geo.status == 200:
                                 text = await geo.text()
                                 for line in text.splitlines():
@@ -377,176 +596,546 @@ class BatchEngine:
                     except Exception: pass
 
                 updated_node = node.model_copy(update={"latency": latency, "speed": speed, "country": country})
-                return {"status": "ok", "node": updated_node}
+                return RECORDER.outcome("speed", node, {"status": "ok", "node": updated_node}, t_start)
         except Exception:
             return {"status": "error"}
 
-    async def check_batch(self, nodes: List[ProxyNode], is_champion: bool = False, batch_num: int = 0) -> List[ProxyNode]:
-        if not nodes: return[]
-
-        batch_id = uuid.uuid4().hex[:8]
-        os.makedirs("data", exist_ok=True)
-        base_port = await self._get_next_base_port(len(nodes))
+    async def _prepare_batch(self, nodes: List[ProxyNode], base_port: int, clash_secret: Optional[str] = None) -> Tuple[List[ProxyNode], Optional[dict]]:
+        config_data = self._generate_batch_config(nodes, base_port, clash_secret)
+        if all(self._VALID_CACHE.get(n.strict_id) for n in nodes):
+            return nodes, config_data
         
-        config_data = self._generate_batch_config(nodes, base_port)
-        
-        if not await self._is_config_valid(config_data, batch_id):
+        if len(self._VALID_CACHE) >= FRAGMENT_CACHE_LIMIT:
+            self._VALID_CACHE.clear()
+        if await self._is_config_valid(config_data):
+            self._VALID_CACHE.update((n.strict_id, True) for n in nodes)
+        else:
             valid_nodes =[]
             for n in nodes:
-                single_cfg = self._generate_batch_config([n], base_port)
-                if await self._is_config_valid(single_cfg, batch_id):
+                ok = self._VALID_CACHE.get(n.strict_id)
+                if ok is None:
+                    ok = await self._is_config_valid(self._generate_batch_config([n], base_port))
+                    self._VALID_CACHE[n.strict_id] = ok
+                if ok:
                     valid_nodes.append(n)
             
             nodes = valid_nodes
-            if not nodes: return[]
-            config_data = self._generate_batch_config(nodes, base_port)
+            if not nodes: return nodes, None
+            config_data = self._generate_batch_config(nodes, base_port, clash_secret)
+
+        return nodes, config_data
+
+    async def _start_singbox(self, config_data: dict, report: dict):
+        if self._config_transport() == "file":
+            config_data["path"] = os.path.join(self._config_dir(), f"run_{uuid.uuid4().hex[:8]}.json")
+            with open(config_data["path"], "w", encoding="utf-8") as f:
+                f.write(config_data["text"])
+
+        proc = await asyncio.create_subprocess_exec(
+            "sing-box", "run", "-c", config_data.get("path", "stdin"),
+            stdin=asyncio.subprocess.DEVNULL if "path" in config_data else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        ports = list(config_data["ports"])
+        if config_data["controller"]:
+            ports.append(int(config_data["controller"].rsplit(":", 1)[1]))
+        try:
+            if proc.stdin:
+                proc.stdin.write(config_data["text"].encode("utf-8"))
+                await proc.stdin.drain()
+                proc.stdin.close()
+            startup = await self._wait_ready(proc, ports, timeout=max(8.0, len(ports) * 0.01))
+        except BaseException:
+            await self._stop_singbox(proc, config_data, {})
+            raise
+        if startup is None:
+            return proc, False
+
+        report["startup"] = startup
+        METRICS.observe("singbox_startup_seconds", startup)
+        logger.debug(f"sing-box готов за {startup * 1000:.0f} мс ({len(ports)} inbounds)")
+        return proc, True
 
-        config_path = f"data/run_{batch_id}.json"
-        proc = None
+    @staticmethod
+    async def _stop_singbox(proc, config_data: Optional[dict], report: dict):
+        if proc and proc.returncode is None:
+            report.update(sample_process(proc.pid))
+            try:
+                proc.kill()
+                await asyncio.wait_for(proc.wait(), timeout=3.0)
+            except Exception: pass
+        config_path = (config_data or {}).get("path")
+        if config_path and os.path.exists(config_path):
+            try: os.remove(config_path)
+            except Exception: pass
+
+    async def check_batch(self, nodes: List[ProxyNode], is_champion: bool = False, batch_num: int = 0, report: Optional[dict] = None, streams: int = 0, phase: str = "full") -> List[ProxyNode]:
+        if not nodes: return[]
+        report = {} if report is None else report
 
-        try:
-            with open(config_path, "w") as f:
-                json.dump(config_data, f)
+        batch_id = uuid.uuid4().hex[:8]
+        base_port = await self._get_next_base_port(len(nodes))
+        
+        use_clash = self.ping_backend == "clash_api"
+        submitted = nodes
+        check_started = time.perf_counter()
+        with PROFILER.span("config_check"):
+            nodes, config_data = await self._prepare_batch(nodes, base_port, self.clash_secret if use_clash else None)
+        check_time = time.perf_counter() - check_started
+        if RECORDER.enabled:
+            valid_ids = {n.strict_id for n in nodes}
+            for n in submitted:
+                RECORDER.record("node", id=n.strict_id, valid=n.strict_id in valid_ids, node=n.model_dump())
+        if not config_data:
+            report["failed"] = True
+            return[]
 
-            proc = await asyncio.create_subprocess_exec(
-                "sing-box", "run", "-c", config_path,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.PIPE,
-                start_new_session=True,
-            )
+        proc = None
+        alive_nodes: List[ProxyNode] =[]
+        outcomes = {}
+        speed_stats = {"ok": 0, "low_speed": 0, "drop": 0, "error": 0}
+        log_prefix = f"[B-{batch_num}]" if batch_num else "[CHAMP]"
 
-            await asyncio.sleep(0.3)
-            if proc.returncode is not None:
-                return[]
+        def log_speed():
+            extra = "".join(f" | {speed_stats[k]} {label}" for k, label in (("deferred", "Deferred"),) if speed_stats.get(k))
+            logger.info(f"   {log_prefix} Speed: {speed_stats['ok']} OK | {speed_stats['low_speed']} Low | {speed_stats['drop']} Drop | {speed_stats['error']} Err{extra}")
 
-            first_port = config_data["inbounds"][0]["listen_port"]
-            if not await self._wait_for_port("127.0.0.1", first_port, timeout=5.0):
+        try:
+            with PROFILER.span("singbox_start"):
+                proc, ready = await self._start_singbox(config_data, report)
+            RECORDER.record(
+                "batch", size=len(nodes), ids=[n.strict_id for n in nodes], ready=bool(ready),
+                check=round(check_time, 3), startup=round(report.get("startup", 0.0), 3),
+            )
+            if not ready:
+                report["failed"] = True
                 return[]
-                
-            await asyncio.sleep(1.0)
 
-            valid_tags = {ob["tag"] for ob in config_data["outbounds"] if ob.get("tag")}
-            
             async def run_phases():
-                ping_tasks =[]
-                delay = 0.0
-                for i in range(len(nodes)):
-                    if f"proxy-{i}" in valid_tags:
-                        ping_tasks.append(self._ping_phase(nodes[i], base_port + i, delay))
-                        delay += 0.02
-
-                ping_results = await asyncio.gather(*ping_tasks, return_exceptions=True)
+                if phase == "speed":
+                    valid_nodes_for_speed =[{"node": nodes[i], "port": base_port + i, "latency": nodes[i].latency} for i in config_data["indices"]]
+                else:
+                    if use_clash:
+                        ping_results = await self._clash_ping_all(config_data, nodes, base_port)
+                    else:
+                        ping_tasks =[]
+                        delay = 0.0
+                        for i in config_data["indices"]:
+                            ping_tasks.append(self._ping_phase(nodes[i], base_port + i, delay))
+                            delay += 0.02
+
+                        ping_results = await asyncio.gather(*ping_tasks, return_exceptions=True)
                 
-                ping_stats = {"ok": 0, "timeout": 0, "high_latency": 0, "error": 0}
-                valid_nodes_for_speed =[]
+                    ping_stats = {"ok": 0, "timeout": 0, "high_latency": 0, "error": 0}
+                    endpoints = {}
+                    valid_nodes_for_speed =[]
                 
-                for res in ping_results:
-                    if isinstance(res, dict):
-                        st = res.get("status", "error")
-                        ping_stats[st] = ping_stats.get(st, 0) + 1
-                        if st == "ok":
-                            valid_nodes_for_speed.append(res)
-                    else:
-                        ping_stats["error"] += 1
+                    for i, res in zip(config_data["indices"], ping_results):
+                        if isinstance(res, dict):
+                            st = res.get("status", "error")
+                            ping_stats[st] = ping_stats.get(st, 0) + 1
+                            METRICS.inc("ping_total", status=st)
+                            if st == "ok":
+                                valid_nodes_for_speed.append(res)
+                                METRICS.observe("ping_latency_ms", res["latency"])
+                                endpoint = urlparse(res.get("endpoint") or "").hostname or "?"
+                                endpoints[endpoint] = endpoints.get(endpoint, 0) + 1
+                                METRICS.inc("ping_endpoint_total", endpoint=endpoint)
+                                continue
+                            outcomes[nodes[i].strict_id] = "rejected" if res.get("permanent") else st
+                        else:
+                            ping_stats["error"] += 1
+                            METRICS.inc("ping_total", status="error")
+                            outcomes[nodes[i].strict_id] = "error"
                             
-                log_prefix = f"[B-{batch_num}]" if batch_num else "[CHAMP]"
-                logger.info(f"   {log_prefix} Ping: {ping_stats['ok']} OK | {ping_stats['timeout']} Timeout | {ping_stats['high_latency']} High Ping | {ping_stats['error']} Err")
+                    via = ""
+                    if len(self._connectivity_urls()) > 1 and endpoints:
+                        via = " (" + ", ".join(f"{host}: {count}" for host, count in sorted(endpoints.items(), key=lambda e: -e[1])) + ")"
+                    logger.info(f"   {log_prefix} Ping: {ping_stats['ok']} OK{via} | {ping_stats['timeout']} Timeout | {ping_stats['high_latency']} High Ping | {ping_stats['error']} Err")
+
+                if phase == "ping":
+                    alive_nodes.extend(vp["node"].model_copy(update={"latency": vp["latency"]}) for vp in valid_nodes_for_speed)
+                    return
                 
                 if not valid_nodes_for_speed:
-                    return[]
+                    return
 
-                speed_tasks =[self._speed_phase(vp, is_champion) for vp in valid_nodes_for_speed]
-                speed_results = await asyncio.gather(*speed_tasks, return_exceptions=True)
-                
-                speed_stats = {"ok": 0, "low_speed": 0, "drop": 0, "error": 0}
-                alive_nodes =[]
-                
-                for res in speed_results:
-                    if isinstance(res, dict):
-                        st = res.get("status", "error")
-                        speed_stats[st] = speed_stats.get(st, 0) + 1
-                        if st == "ok":
-                            alive_nodes.append(res["node"])
-                    else:
-                        speed_stats["error"] += 1
-                        
-                logger.info(f"   {log_prefix} Speed: {speed_stats['ok']} OK | {speed_stats['low_speed']} Low | {speed_stats['drop']} Drop | {speed_stats['error']} Err")
-                return alive_nodes
-
-            alive_nodes = await asyncio.wait_for(run_phases(), timeout=BATCH_HARD_TIMEOUT)
+                speed_deadline = phases_started + self.hard_timeout - self.deadline_margin
+                tasks = {asyncio.create_task(self._speed_phase(vp, is_champion, speed_deadline, streams)): vp["node"] for vp in valid_nodes_for_speed}
+                pending = set(tasks)
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            res = task.result() if not task.exception() else None
+                            st = res.get("status", "error") if isinstance(res, dict) else "error"
+                            outcomes[tasks[task].strict_id] = st
+                            speed_stats[st] = speed_stats.get(st, 0) + 1
+                            METRICS.inc("speed_total", status=st)
+                            if st == "ok":
+                                alive_nodes.append(res["node"])
+                                METRICS.observe("speed_mbps", res["node"].speed)
+                finally:
+                    for task in pending:
+                        task.cancel()
+
+                log_speed()
+
+            with PROFILER.span("phases"):
+                phases_started = time.monotonic()
+                await asyncio.wait_for(run_phases(), timeout=self.hard_timeout)
 
         except asyncio.TimeoutError:
-            logger.warning(f"Жесткий таймаут батча {batch_id}.")
-            return[]
+            if any(speed_stats.values()):
+                log_speed()
+            logger.warning(f"Жесткий таймаут батча {batch_id}: сохранено {len(alive_nodes)} узлов, прошедших проверку.")
+            report["timed_out"] = True
+            METRICS.inc("batch_salvaged_nodes_total", len(alive_nodes))
+            return alive_nodes
         except Exception:
+            report["failed"] = True
             return[]
         finally:
-            if proc and proc.returncode is None:
-                try:
-                    proc.kill()
-                    await asyncio.wait_for(proc.wait(), timeout=3.0)
-                except Exception: pass
-            if os.path.exists(config_path):
-                try: os.remove(config_path)
-                except Exception: pass
+            await self._stop_singbox(proc, config_data, report)
+            alive_ids = {n.strict_id for n in alive_nodes}
+            report["retry_ids"] =[
+                n.strict_id for n in nodes
+                if n.strict_id not in alive_ids and outcomes.get(n.strict_id, "unfinished") in TRANSIENT_STATUSES
+            ]
 
         return alive_nodes
 
+    async def check_champions(self, nodes: List[ProxyNode]) -> List[ProxyNode]:
+        if not nodes: return[]
+
+        base_port = await self._get_next_base_port(len(nodes))
+
+        nodes, config_data = await self._prepare_batch(nodes, base_port)
+        if not config_data: return[]
+
+        proc = None
+        champions =[]
+
+        try:
+            proc, ready = await self._start_singbox(config_data, {})
+            if not ready: return[]
+
+            ping_results = await asyncio.gather(*[
+                self._ping_phase(nodes[i], base_port + i, 0.0)
+                for i in config_data["indices"]
+            ], return_exceptions=True)
+
+            for res in ping_results:
+                if not isinstance(res, dict) or res.get("status") != "ok":
+                    continue
+                try:
+                    speed_res = await asyncio.wait_for(self._speed_phase(res, True), timeout=CHAMPION_TIMEOUT)
+                except asyncio.TimeoutError:
+                    continue
+                if speed_res.get("status") == "ok":
+                    champions.append(speed_res["node"])
+                    logger.info(f"   ⪼ {speed_res['node'].config.server} → {speed_res['node'].speed} Mbps")
+        except Exception as e:
+            logger.warning(f"Сбой финального прогона: {e}")
+        finally:
+            await self._stop_singbox(proc, config_data, {})
+
+        return champions
+
 class Inspector:
-    def __init__(self):
+    def __init__(self, history: Optional[RunHistory] = None):
         self.batch_engine = BatchEngine()
-        self.batch_semaphore = asyncio.Semaphore(5)
+        self.controller = AdaptiveController()
+        self.history = history or RunHistory()
+        self.checked_nodes: List[ProxyNode] =[]
+        self._slots = asyncio.Condition()
+        self._active = 0
+        self.workers = int(CONFIG.workers.get("processes", 1))
+        self.pool: Optional[WorkerPool] = None
+        self.two_tier = bool(CONFIG.two_tier.get("enabled", False))
+        self.retry_queue: List[ProxyNode] =[]
+
+    async def _acquire_slot(self):
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._active < self.controller.concurrency)
+            self._active += 1
+
+    async def _release_slot(self):
+        async with self._slots:
+            self._active -= 1
+            self._slots.notify_all()
+
+    async def _run_batch(self, batch: List[ProxyNode], batch_num: int, report: dict, phase: str = "full") -> List[ProxyNode]:
+        if self.pool:
+            return await self.pool.run_batch(batch, batch_num, report, phase)
+        return await self.batch_engine.check_batch(batch, batch_num=batch_num, report=report, phase=phase)
+
+    def _queue_retries(self, batch: List[ProxyNode], report: dict):
+        retry_ids = set(report.get("retry_ids", []))
+        self.retry_queue.extend(n for n in batch if n.strict_id in retry_ids)
+
+    async def _process_batch_with_sema(self, batch: List[ProxyNode], batch_num: int, scheduler: DeadlineScheduler, checkpoint: Optional[Checkpoint]) -> List[ProxyNode]:
+        report = {"size": len(batch)}
+        try:
+            logger.info(f"⬚ Батч {batch_num}: старт ({len(batch)} узлов, параллельно {self._active}/{self.controller.concurrency})...")
+            t0 = time.monotonic()
+            with PROFILER.span(f"batch-{batch_num}"):
+                results = await self._run_batch(batch, batch_num, report)
+            report["duration"] = time.monotonic() - t0
+            report["alive"] = len(results)
+            METRICS.observe("batch_seconds", report["duration"])
+            METRICS.inc("batches_total", outcome="timeout" if report.get("timed_out") else ("failed" if report.get("failed") else "ok"))
+            METRICS.inc("batch_nodes_total", len(batch))
+            METRICS.inc("batch_alive_total", len(results))
+            scheduler.observe(report["duration"])
+            self.controller.observe(report)
+            if checkpoint:
+                checkpoint.record_batch(batch, results)
+            self._queue_retries(batch, report)
+            logger.info(f"   ✧ Живых в батче {batch_num}: {len(results)}/{len(batch)} (старт sing-box {report.get('startup', 0.0) * 1000:.0f} мс)")
+            return results
+        finally:
+            await self._release_slot()
+
+    async def _retry_transient(self, batch_num: int, scheduler: DeadlineScheduler, checkpoint: Optional[Checkpoint]) -> List[ProxyNode]:
+        cfg = CONFIG.retry
+        queue, self.retry_queue = self.retry_queue,[]
+        if not cfg.get("enabled", True) or not queue:
+            return[]
 
-    async def _process_batch_with_sema(self, batch: List[ProxyNode], batch_num: int, total_batches: int) -> List[ProxyNode]:
-        async with self.batch_semaphore:
-            logger.info(f"⬚ Батч {batch_num}/{total_batches}: старт ({len(batch)} узлов)...")
-            results = await self.batch_engine.check_batch(batch, batch_num=batch_num)
-            logger.info(f"   ✧ Живых в батче {batch_num}: {len(results)}/{len(batch)}")
+        size = max(1, int(cfg.get("batch_size", 30)))
+        concurrency = max(1, int(cfg.get("concurrency", 2)))
+        semaphore = asyncio.Semaphore(concurrency)
+        logger.info(f"↻ Повтор: {len(queue)} узлов с временными сбоями, батч {size}, параллельно {concurrency}")
+
+        skipped = 0
+
+        async def run(batch: List[ProxyNode], num: int) -> List[ProxyNode]:
+            nonlocal skipped
+            async with semaphore:
+                if not scheduler.admit():
+                    skipped += len(batch)
+                    return[]
+                report = {"size": len(batch)}
+                with PROFILER.span(f"retry-{num}"):
+                    results = await self._run_batch(batch, num, report)
+                if checkpoint:
+                    checkpoint.record_batch(batch, results)
+                return results
+
+        batches =[queue[i: i + size] for i in range(0, len(queue), size)]
+        results_nested = await asyncio.gather(*[run(b, batch_num + i + 1) for i, b in enumerate(batches)], return_exceptions=True)
+        recovered =[n for res in results_nested if isinstance(res, list) for n in res]
+
+        attempted = len(queue) - skipped
+        METRICS.inc("retry_nodes_total", attempted)
+        METRICS.inc("retry_recovered_total", len(recovered))
+        rate = len(recovered) / attempted if attempted else 0.0
+        tail = f", пропущено по дедлайну {skipped}" if skipped else ""
+        logger.success(f"↻ Повтор: восстановлено {len(recovered)}/{attempted} ({rate:.0%}){tail}")
+        return recovered
+
+    async def _process_classic(self, queue: List[ProxyNode], scheduler: DeadlineScheduler, checkpoint: Optional[Checkpoint]) -> Tuple[list, int]:
+        total = len(queue)
+        tasks =[]
+        pos = 0
+        batch_num = 0
+        while pos < total:
+            await self._acquire_slot()
+            if not scheduler.admit():
+                await self._release_slot()
+                logger.warning(
+                    f"⏱ Дедлайн: осталось {scheduler.remaining():.0f}s, прогноз батча {scheduler.batch_estimate:.0f}s. "
+                    f"Пропущено {total - pos} узлов"
+                )
+                break
+            batch = queue[pos: pos + self.controller.batch_size]
+            pos += len(batch)
+            batch_num += 1
+            self.checked_nodes.extend(batch)
+            tasks.append(asyncio.create_task(self._process_batch_with_sema(batch, batch_num, scheduler, checkpoint)))
+
+        return await asyncio.gather(*tasks, return_exceptions=True), batch_num
+
+    def _two_tier_sizes(self) -> Tuple[int, int, int]:
+        cfg = CONFIG.two_tier
+        ping_size = max(1, int(cfg.get("ping_batch_size", 1000)))
+        downloads = max(1, int(float(cfg.get("bandwidth_mbps", 400)) // max(float(cfg.get("node_mbps", 40)), 1.0)))
+        per_batch = max(1, downloads // max(self.workers, 1) // max(1, int(cfg.get("speed_concurrency", 2))))
+        speed_size = max(1, int(per_batch * float(cfg.get("speed_batch_time", 60)) / SPEED_TIMEOUT))
+        return ping_size, downloads, speed_size
+
+    async def _process_two_tier(self, queue: List[ProxyNode], scheduler: DeadlineScheduler, checkpoint: Optional[Checkpoint]) -> Tuple[list, int]:
+        cfg = CONFIG.two_tier
+        ping_size, downloads, speed_size = self._two_tier_sizes()
+        ping_slots = asyncio.Semaphore(max(1, int(cfg.get("ping_concurrency", 2))))
+        speed_slots = asyncio.Semaphore(max(1, int(cfg.get("speed_concurrency", 2))))
+        logger.info(
+            f"⏣ Два уровня: пинг-батчи по {ping_size}, скоростные по {speed_size} "
+            f"({downloads} загрузок одновременно, бюджет {cfg.get('bandwidth_mbps', 400)} Мбит/с)"
+        )
+
+        survivors: List[ProxyNode] =[]
+        speed_tasks =[]
+        batch_num = 0
+        skipped = 0
+
+        async def run(batch: List[ProxyNode], num: int, phase: str) -> List[ProxyNode]:
+            report = {"size": len(batch)}
+            t0 = time.monotonic()
+            with PROFILER.span(f"{phase}-{num}"):
+                results = await self._run_batch(batch, num, report, phase)
+            report["duration"] = time.monotonic() - t0
+            METRICS.observe("batch_seconds", report["duration"])
+            METRICS.inc("batches_total", outcome="timeout" if report.get("timed_out") else ("failed" if report.get("failed") else "ok"))
+            scheduler.observe(report["duration"])
+            self._queue_retries(batch, report)
             return results
 
-    async def process_all(self, nodes: List[ProxyNode]) -> List[ProxyNode]:
+        async def speed_batch(batch: List[ProxyNode], num: int) -> List[ProxyNode]:
+            nonlocal skipped
+            async with speed_slots:
+                if not scheduler.admit():
+                    skipped += len(batch)
+                    return[]
+                self.checked_nodes.extend(batch)
+                results = await run(batch, num, "speed")
+            METRICS.inc("batch_nodes_total", len(batch))
+            METRICS.inc("batch_alive_total", len(results))
+            if checkpoint:
+                checkpoint.record_batch(batch, results)
+            logger.info(f"   ✧ Живых в скоростном батче {num}: {len(results)}/{len(batch)}")
+            return results
+
+        def flush(force: bool = False):
+            nonlocal batch_num
+            while len(survivors) >= speed_size or (force and survivors):
+                batch = survivors[:speed_size]
+                del survivors[:speed_size]
+                batch_num += 1
+                speed_tasks.append(asyncio.create_task(speed_batch(batch, batch_num)))
+
+        async def ping_batch(batch: List[ProxyNode], num: int):
+            nonlocal skipped
+            async with ping_slots:
+                if not scheduler.admit():
+                    skipped += len(batch)
+                    return
+                logger.info(f"⬚ Пинг-батч {num}: старт ({len(batch)} узлов)...")
+                results = await run(batch, num, "ping")
+            passed = {n.strict_id for n in results}
+            self.checked_nodes.extend(n for n in batch if n.strict_id not in passed)
+            if checkpoint:
+                checkpoint.record_batch([n for n in batch if n.strict_id not in passed], [])
+            METRICS.inc("two_tier_ping_passed_total", len(results))
+            survivors.extend(results)
+            flush()
+            logger.info(f"   ✧ Пинг-батч {num}: прошло {len(results)}/{len(batch)}, ждут замера скорости {len(survivors)}")
+
+        ping_batches =[queue[i: i + ping_size] for i in range(0, len(queue), ping_size)]
+        batch_num = len(ping_batches)
+        saved = self.batch_engine.speed_semaphore
+        self.batch_engine.speed_semaphore = asyncio.Semaphore(downloads)
+        try:
+            await asyncio.gather(*[ping_batch(b, i + 1) for i, b in enumerate(ping_batches)], return_exceptions=True)
+            flush(force=True)
+            results_nested = await asyncio.gather(*speed_tasks, return_exceptions=True)
+        finally:
+            self.batch_engine.speed_semaphore = saved
+
+        if skipped:
+            logger.warning(f"⏱ Дедлайн: осталось {scheduler.remaining():.0f}s, пропущено {skipped} узлов")
+        return results_nested, batch_num
+
+    async def process_all(self, nodes: List[ProxyNode], deadline: Optional[float] = None, checkpoint: Optional[Checkpoint] = None) -> List[ProxyNode]:
         alive_total: List[ProxyNode] =[]
-        batch_size = getattr(CONFIG, "BATCH_SIZE", 100)
+        self.checked_nodes =[]
+        self.retry_queue =[]
+        BatchEngine._GEO_CACHE.clear()
+
+        if checkpoint and checkpoint.done_ids:
+            current = {n.strict_id for n in nodes}
+            alive_total = [n for n in checkpoint.alive if n.strict_id in current]
+            self.checked_nodes = [n for n in nodes if n.strict_id in checkpoint.done_ids]
+            nodes = [n for n in nodes if n.strict_id not in checkpoint.done_ids]
+            BatchEngine._GEO_CACHE.update({n.config.server: n.country for n in alive_total if n.country != "UN"})
+            logger.info(f"⟲ Из журнала: {len(self.checked_nodes)} узлов пропущено, {len(alive_total)} живых восстановлено")
+
         total = len(nodes)
+        logger.info(f"⏣ Matrix Protocol: {total} узлов, стартовый батч: {self.controller.batch_size}, параллельно: {self.controller.concurrency}")
 
-        BatchEngine._GEO_CACHE.clear()
-        total_batches = (total + batch_size - 1) // batch_size
-        logger.info(f"⏣ Matrix Protocol: {total} узлов, размер батча: {batch_size}, всего батчей: {total_batches}")
+        scheduler = DeadlineScheduler(self.history, deadline)
+        queue = scheduler.order(nodes)
 
-        tasks =[]
-        for i in range(0, total, batch_size):
-            batch = nodes[i: i + batch_size]
-            batch_num = i // batch_size + 1
-            tasks.append(self._process_batch_with_sema(batch, batch_num, total_batches))
-            
-        results_nested = await asyncio.gather(*tasks, return_exceptions=True)
+        if self.workers > 1:
+            slots = self._two_tier_sizes()[1] if self.two_tier else 5
+            self.pool = WorkerPool(self.workers, int(CONFIG.workers.get("jobs_per_worker", 3)), slots)
+            BatchEngine.configure_ports(*self.pool.local_ports)
+            await self.pool.start()
+
+        try:
+            if self.two_tier:
+                results_nested, batch_num = await self._process_two_tier(queue, scheduler, checkpoint)
+            else:
+                results_nested, batch_num = await self._process_classic(queue, scheduler, checkpoint)
+            results_nested.append(await self._retry_transient(batch_num, scheduler, checkpoint))
+        finally:
+            if self.pool:
+                BatchEngine._GEO_CACHE.update(self.pool.geo_cache)
+                await self.pool.close()
+                self.pool = None
         
         for res in results_nested:
             if isinstance(res, list):
                 alive_total.extend(res)
 
+        logger.info(f"⏣ Обработано батчей: {batch_num}, итоговый батч: {self.controller.batch_size}, параллельно: {self.controller.concurrency}")
         return alive_total
 
-    async def champion_run(self, nodes: List[ProxyNode]) -> float:
+    async def _multistream_tier(self, tier: List[ProxyNode], streams: int, budget: float) -> List[ProxyNode]:
+        engine = self.batch_engine
+        saved = engine.speed_semaphore, engine.hard_timeout
+        engine.speed_semaphore = asyncio.Semaphore(max(1, int(CONFIG.checking.get("multistream_concurrency", 2))))
+        engine.hard_timeout = min(engine.hard_timeout, budget)
+        try:
+            return await engine.check_batch(tier, report={}, streams=streams)
+        finally:
+            engine.speed_semaphore, engine.hard_timeout = saved
+
+    async def champion_run(self, nodes: List[ProxyNode], deadline: Optional[float] = None) -> float:
         if not nodes: return 0.0
 
+        by_id = {n.strict_id: n for n in nodes}
         nodes.sort(key=lambda x: x.speed, reverse=True)
-        candidates = nodes[:5]
-        logger.info(f"⚝ Финал: топ-{len(candidates)} кандидатов (Full Speed)...")
+
+        top_n = int(CONFIG.checking.get("multistream_top", 50))
+        streams = int(CONFIG.checking.get("champion_streams", 4))
+        budget = BATCH_HARD_TIMEOUT
+        if deadline is not None:
+            budget = deadline - time.monotonic() - CHAMPION_TIMEOUT * CHAMPION_COUNT - PUBLISH_MARGIN
+        if top_n > 0 and streams > 1 and budget < SPEED_TIMEOUT + GEO_LOOKUP_TIMEOUT + NODE_DEADLINE_MARGIN:
+            logger.warning(f"⚝ Тир-замер пропущен: до конца бюджета остаётся {budget:.0f}s сверх финала")
+        elif top_n > 0 and streams > 1:
+            tier = nodes[:top_n]
+            logger.info(f"⚝ Тир-замер: топ-{len(tier)} в {streams} потоков на узел, до {min(budget, BATCH_HARD_TIMEOUT):.0f}s...")
+            before = {n.strict_id: n.speed for n in tier}
+            remeasured = await self._multistream_tier(tier, streams, budget)
+            for node in remeasured:
+                by_id[node.strict_id].speed = node.speed
+            if remeasured:
+                gain = sorted(n.speed / max(before[n.strict_id], 0.1) for n in remeasured)[len(remeasured) // 2]
+                logger.info(f"   ⪼ Перемерено {len(remeasured)}/{len(tier)}, медианный прирост ×{gain:.2f}")
+            nodes.sort(key=lambda x: x.speed, reverse=True)
+
+        candidates = nodes[:CHAMPION_COUNT]
+        logger.info(f"⚝ Финал: топ-{len(candidates)} кандидатов (Full Speed, один процесс sing-box)...")
 
         max_speed = 0.0
-        for node in candidates:
-            results = await self.batch_engine.check_batch([node], is_champion=True)
-            if results:
-                champ = results[0]
-                logger.info(f"   ⪼ {champ.config.server} → {champ.speed} Mbps")
-                for n in nodes:
-                    if n.strict_id == champ.strict_id:
-                        n.speed = champ.speed
-                        break
-                if champ.speed > max_speed:
-                    max_speed = champ.speed
-            else:
-                pass
+        for champ in await self.batch_engine.check_champions(candidates):
+            by_id[champ.strict_id].speed = champ.speed
+            if champ.speed > max_speed:
+                max_speed = champ.speed
 
         return max_speed
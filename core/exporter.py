@@ -3,17 +3,91 @@ import os
 import datetime
 import base64
 import json
+import gzip
 import hashlib
+import heapq
 import ipaddress
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import aiohttp
 from loguru import logger
 
 from core.models import ProxyNode
 from core.settings import CONFIG
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_PATH = "manifest.json"
+DELTA_PATH = "delta.json"
+EXPORT_STATE_PATH = "data/export_state.json"
+TIERS_DIR = "tiers"
+ASSETS_DIR = "assets"
+STATS_PATH = "stats.json"
+
+
+class ExportEntry:
+    __slots__ = ("node", "id", "name", "line")
+
+    def __init__(self, node: ProxyNode, node_id: str, name: str, line: str):
+        self.node = node
+        self.id = node_id
+        self.name = name
+        self.line = line
+
+
+def _tier_rank(entry: ExportEntry) -> tuple:
+    return -entry.node.speed, entry.node.latency, entry.id
+
+
+def _select_tier(ranked: List[Tuple[int, ExportEntry]], limit: int) -> List[str]:
+    chosen = heapq.nsmallest(limit, ranked, key=lambda r: _tier_rank(r[1]))
+    return [entry.line for _, entry in sorted(chosen, key=lambda r: r[0])]
+
+
+class SubscriptionOutput:
+    def __init__(self, path: str, title: str, accept: Optional[Callable[[ProxyNode], bool]] = None, limit: int = 0):
+        self.path = path
+        self.title = title
+        self.accept = accept
+        self.limit = limit
+        self.ranked: List[Tuple[int, ExportEntry]] = []
+
+    def feed(self, entry: ExportEntry):
+        if self.accept is None or self.accept(entry.node):
+            self.ranked.append((len(self.ranked), entry))
+
+    def files(self) -> List[Tuple[str, str]]:
+        if self.limit:
+            lines = _select_tier(self.ranked, self.limit)
+        else:
+            lines = [entry.line for _, entry in self.ranked]
+        return [(self.path, Exporter.render_subscription(self.title, lines))]
+
+
+class GroupedOutput:
+    def __init__(self, directory: str, key: Callable[[ProxyNode], str], title: Callable[[str], str], limit: int):
+        self.directory = directory
+        self.key = key
+        self.title = title
+        self.limit = limit
+        self.groups: Dict[str, List[Tuple[int, ExportEntry]]] = {}
+
+    def feed(self, entry: ExportEntry):
+        ranked = self.groups.setdefault(self.key(entry.node), [])
+        ranked.append((len(ranked), entry))
+
+    def files(self) -> List[Tuple[str, str]]:
+        return [
+            (os.path.join(self.directory, f"{key.lower()}.txt"), Exporter.render_subscription(self.title(key), _select_tier(ranked, self.limit)))
+            for key, ranked in sorted(self.groups.items())
+        ]
+
 
 class Exporter:
+    OUTPUT_PLUGINS: List[Callable[[], Any]] = []
+
     @staticmethod
     def _flag(code: str) -> str:
         if not code or code == "UN": return "❓"
@@ -169,17 +243,188 @@ class Exporter:
             return node.raw_uri or ""
 
     @staticmethod
-    def generate_subscription(nodes: List[ProxyNode], title: str) -> str:
+    def _speed_bucket(speed: float, buckets: List[float]) -> int:
+        for i, bound in enumerate(buckets):
+            if speed >= bound:
+                return i
+        return len(buckets)
+
+    @staticmethod
+    def _node_name(node: ProxyNode, node_id: str, channel_tag: str) -> str:
+        flag = Exporter._flag(node.country)
+        sni = node.config.sni or node.config.host or node.config.server
+        proto = node.protocol.upper()
+        return f"{flag} {node.country} | {sni} | {proto}[{node_id[:4].upper()}] | {channel_tag}"
+
+    @staticmethod
+    def build_entries(nodes: List[ProxyNode]) -> List[ExportEntry]:
         channel_tag = CONFIG.app.get("channel_tag", "@SunnyAreral")
-        lines =[f"#profile-title: {title}", "#profile-update-interval: 6"]
-        for node in sorted(nodes, key=lambda x: x.speed, reverse=True):
-            flag = Exporter._flag(node.country)
-            sni = node.config.sni or node.config.host or node.config.server
-            proto = node.protocol.upper()
-            short_hash = hashlib.md5(node.strict_id.encode("utf-8")).hexdigest()[:4].upper()
-            name = f"{flag} {node.country} | {sni} | {proto}[{short_hash}] | {channel_tag}"
-            lines.append(Exporter._build_url(node, name))
-        return "\n".join(lines)
+        buckets = sorted((float(b) for b in CONFIG.export.get("speed_buckets", [100, 50, 20, 10, 5])), reverse=True)
+        ranked =[]
+        for node in nodes:
+            node_id = hashlib.md5(node.strict_id.encode("utf-8")).hexdigest()[:16]
+            ranked.append((Exporter._speed_bucket(node.speed, buckets), node_id, node))
+
+        entries =[]
+        for _, node_id, node in sorted(ranked, key=lambda r: r[:2]):
+            name = Exporter._node_name(node, node_id, channel_tag)
+            entries.append(ExportEntry(node, node_id, name, Exporter._build_url(node, name)))
+        return entries
+
+    @staticmethod
+    def _write_delta(entries: List[ExportEntry], manifest: dict) -> dict:
+        try:
+            with open(EXPORT_STATE_PATH, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except Exception:
+            previous = None
+
+        current = {e.id: hashlib.sha1(e.line.encode("utf-8")).hexdigest()[:16] for e in entries}
+        if previous is None:
+            delta = {"total": len(entries), "added": [], "removed": [], "changed": [], "initial": True}
+        else:
+            delta = {
+                "total": len(entries),
+                "added": [{"id": e.id, "line": e.line} for e in entries if e.id not in previous],
+                "removed": sorted(set(previous) - set(current)),
+                "changed": [{"id": e.id, "line": e.line} for e in entries if e.id in previous and previous[e.id] != current[e.id]],
+            }
+
+        os.makedirs(os.path.dirname(EXPORT_STATE_PATH), exist_ok=True)
+        Exporter._replace_file(EXPORT_STATE_PATH, json.dumps(current, sort_keys=True).encode("utf-8"))
+        Exporter._write_if_changed(DELTA_PATH, json.dumps(delta, ensure_ascii=False, indent=1) + "\n", manifest)
+        return delta
+
+    @staticmethod
+    def render_subscription(title: str, lines: List[str]) -> str:
+        return "\n".join([f"#profile-title: {title}", "#profile-update-interval: 6", *lines])
+
+    @staticmethod
+    def generate_subscription(nodes: List[ProxyNode], title: str) -> str:
+        return Exporter.render_subscription(title, [e.line for e in Exporter.build_entries(nodes)])
+
+    @staticmethod
+    def default_outputs() -> list:
+        outputs =[
+            SubscriptionOutput("sub_all.txt", "SunnyAreral | MIX База"),
+            SubscriptionOutput("sub_bs.txt", "SunnyAreral | Обход БС", accept=lambda n: n.is_bs),
+            SubscriptionOutput("sub_chs.txt", "SunnyAreral | Обход ЧС", accept=lambda n: not n.is_bs),
+        ]
+
+        cfg = CONFIG.export.get("tiers", {})
+        top_n = int(cfg.get("top", 0))
+        if top_n > 0:
+            outputs.append(SubscriptionOutput(os.path.join(TIERS_DIR, "top.txt"), f"SunnyAreral | ТОП-{top_n}", limit=top_n))
+
+        per_country = int(cfg.get("per_country", 0))
+        if per_country > 0:
+            outputs.append(GroupedOutput(
+                os.path.join(TIERS_DIR, "country"), lambda n: n.country,
+                lambda cc: f"SunnyAreral | {Exporter._flag(cc)} {cc} ТОП-{per_country}", per_country,
+            ))
+
+        per_protocol = int(cfg.get("per_protocol", 0))
+        if per_protocol > 0:
+            outputs.append(GroupedOutput(
+                os.path.join(TIERS_DIR, "proto"), lambda n: n.protocol,
+                lambda proto: f"SunnyAreral | {proto.upper()} ТОП-{per_protocol}", per_protocol,
+            ))
+        return outputs
+
+    @staticmethod
+    def _replace_file(path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_if_changed(path: str, content: str, manifest: dict) -> bool:
+        data = content.encode("utf-8")
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        entry = {"etag": f'"{etag}"', "size": len(data)}
+        formats = CONFIG.export.get("precompress", ["gzip", "br"])
+
+        try:
+            with open(path, "rb") as f:
+                changed = f.read() != data
+        except OSError:
+            changed = True
+
+        variants = {}
+        if "gzip" in formats:
+            variants[f"{path}.gz"] = lambda: gzip.compress(data, compresslevel=9, mtime=0)
+        if "br" in formats and brotli is not None:
+            variants[f"{path}.br"] = lambda: brotli.compress(data, quality=11)
+
+        if changed:
+            Exporter._replace_file(path, data)
+        for variant, compress in variants.items():
+            if changed or not os.path.exists(variant):
+                Exporter._replace_file(variant, compress())
+            entry[variant.rsplit(".", 1)[1]] = os.path.getsize(variant)
+
+        manifest[path] = entry
+        return changed
+
+    @staticmethod
+    def _write_manifest(manifest: dict):
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                previous = json.load(f).get("files", {})
+        except Exception:
+            previous = {}
+        merged = {k: v for k, v in previous.items() if not k.startswith((TIERS_DIR + os.sep, ASSETS_DIR + os.sep))}
+        merged.update(manifest)
+        if merged == previous:
+            return
+        content = json.dumps({"files": merged}, ensure_ascii=False, indent=2, sort_keys=True)
+        Exporter._replace_file(MANIFEST_PATH, (content + "\n").encode("utf-8"))
+
+    @staticmethod
+    def _prune_tiers(keep: set):
+        for root, _, files in os.walk(TIERS_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                base = path[:-3] if path.endswith((".gz", ".br")) else path
+                if base not in keep:
+                    try: os.remove(path)
+                    except OSError: pass
+
+    @staticmethod
+    def _publish_asset(source: str, manifest: dict) -> str:
+        with open(source, "r", encoding="utf-8") as f:
+            content = f.read()
+        stem, ext = os.path.splitext(os.path.basename(source))
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(ASSETS_DIR, f"{stem}.{digest}{ext}")
+        os.makedirs(ASSETS_DIR, exist_ok=True)
+        Exporter._write_if_changed(path, content, manifest)
+        return path
+
+    @staticmethod
+    def _prune_assets(keep: set):
+        if not os.path.isdir(ASSETS_DIR):
+            return
+        for name in os.listdir(ASSETS_DIR):
+            path = os.path.join(ASSETS_DIR, name)
+            base = path[:-3] if path.endswith((".gz", ".br")) else path
+            if base not in keep:
+                try: os.remove(path)
+                except OSError: pass
+
+    @staticmethod
+    def build_stats(nodes: List[ProxyNode]) -> dict:
+        now = datetime.datetime.utcnow() + datetime.timedelta(hours=3)
+        countries: Dict[str, int] = {}
+        for node in nodes:
+            countries[node.country] = countries.get(node.country, 0) + 1
+        return {
+            "updated": now.strftime("%d.%m %H:%M"),
+            "proxy_count": len(nodes),
+            "max_speed": int(max((n.speed for n in nodes), default=0.0)),
+            "countries": dict(sorted(countries.items())),
+        }
 
     @staticmethod
     def save_files(nodes: List[ProxyNode]):
@@ -187,45 +432,71 @@ class Exporter:
             logger.warning("⚠ Пустой список нод — файлы подписок НЕ перезаписываются")
             return
 
-        nodes_bs =[n for n in nodes if n.is_bs]
-        nodes_chs =[n for n in nodes if not n.is_bs]
-
-        for filename, node_list, title in[
-            ("sub_all.txt", nodes, "SunnyAreral | MIX База"),
-            ("sub_bs.txt", nodes_bs, "SunnyAreral | Обход БС"),
-            ("sub_chs.txt", nodes_chs, "SunnyAreral | Обход ЧС"),
-        ]:
-            try:
-                with open(filename, "w", encoding="utf-8") as f:
-                    f.write(Exporter.generate_subscription(node_list, title))
-            except Exception as e:
-                logger.error(f"Ошибка сохранения {filename}: {e}")
+        manifest = {}
+        unchanged =[]
+
+        entries = Exporter.build_entries(nodes)
+        outputs = Exporter.default_outputs() + [factory() for factory in Exporter.OUTPUT_PLUGINS]
+        for entry in entries:
+            for output in outputs:
+                output.feed(entry)
+
+        tier_files = set()
+        for output in outputs:
+            for filename, content in output.files():
+                try:
+                    if os.path.dirname(filename):
+                        os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    if not Exporter._write_if_changed(filename, content, manifest):
+                        unchanged.append(filename)
+                    if filename.startswith(TIERS_DIR + os.sep):
+                        tier_files.add(filename)
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения {filename}: {e}")
+
+        Exporter._prune_tiers(tier_files)
+        if tier_files:
+            logger.info(f"☰ Тиры: {len(tier_files)} списков в {TIERS_DIR}/")
+
+        try:
+            delta = Exporter._write_delta(entries, manifest)
+            logger.info(f"Δ Изменения: +{len(delta['added'])} / -{len(delta['removed'])} / ~{len(delta['changed'])} → {DELTA_PATH}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения {DELTA_PATH}: {e}")
 
         try:
+            stats = json.dumps(Exporter.build_stats(nodes), ensure_ascii=False, sort_keys=True)
+            if not Exporter._write_if_changed(STATS_PATH, stats + "\n", manifest):
+                unchanged.append(STATS_PATH)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения {STATS_PATH}: {e}")
+
+        try:
+            css_path = Exporter._publish_asset("config/web/style.css", manifest)
+            js_path = Exporter._publish_asset("config/web/main.js", manifest)
+            Exporter._prune_assets({css_path, js_path})
+
             with open("config/web/template.html", "r", encoding="utf-8") as f:
                 tpl = f.read()
-            with open("config/web/style.css", "r", encoding="utf-8") as f:
-                css = f.read()
-            with open("config/web/main.js", "r", encoding="utf-8") as f:
-                js = f.read()
-
-            top_speed = max((n.speed for n in nodes), default=0.0)
-            now = datetime.datetime.utcnow() + datetime.timedelta(hours=3)
             public_url = CONFIG.app.get("public_url", "")
 
             html_out = (
-                tpl.replace("{{INJECT_CSS}}", css)
-                   .replace("{{INJECT_JS}}", js)
-                   .replace("{{UPDATE_TIME}}", now.strftime("%d.%m %H:%M"))
-                   .replace("{{PROXY_COUNT}}", str(len(nodes)))
-                   .replace("{{MAX_SPEED}}", str(int(top_speed)))
+                tpl.replace("{{CSS_URL}}", "/" + css_path.replace(os.sep, "/"))
+                   .replace("{{JS_URL}}", "/" + js_path.replace(os.sep, "/"))
                    .replace("{{SUB_LINK}}", f"{public_url}/sub")
             )
-            with open("index.html", "w", encoding="utf-8") as f:
-                f.write(html_out)
+            if not Exporter._write_if_changed("index.html", html_out, manifest):
+                unchanged.append("index.html")
         except Exception as e:
             logger.error(f"HTML build error: {e}")
 
+        try:
+            Exporter._write_manifest(manifest)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения {MANIFEST_PATH}: {e}")
+        if unchanged:
+            logger.info(f"≡ Без изменений: {', '.join(unchanged)}")
+
     @staticmethod
     async def send_telegram_report(total_parsed: int, alive_nodes: List[ProxyNode], duration: float, dead_sources: List[str]):
         if not CONFIG.TG_BOT_TOKEN or not CONFIG.TG_CHAT_ID: 
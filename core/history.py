@@ -0,0 +1,111 @@
+import json
+import os
+import time
+from typing import Iterable, List, Dict, Optional
+from loguru import logger
+
+from core.models import ProxyNode
+
+HISTORY_PATH = "data/history.json"
+NODE_TTL = 7 * 24 * 3600
+SOURCE_EMA = 0.5
+
+
+class RunHistory:
+    def __init__(self, path: str = HISTORY_PATH):
+        self.path = path
+        self.nodes: Dict[str, dict] = {}
+        self.sources: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: str = HISTORY_PATH) -> "RunHistory":
+        history = cls(path)
+        if not os.path.exists(path):
+            return history
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            history.nodes = data.get("nodes", {})
+            history.sources = data.get("sources", {})
+            logger.info(f"⟲ История: {len(history.nodes)} известных рабочих узлов, {len(history.sources)} источников")
+        except Exception as e:
+            logger.warning(f"История {path} повреждена, игнорируется: {e}")
+        return history
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"nodes": self.nodes, "sources": self.sources}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения истории: {e}")
+
+    def node_ratio(self, node: ProxyNode) -> float:
+        entry = self.nodes.get(node.strict_id)
+        if not entry:
+            return 0.0
+        return entry.get("ok", 0) / max(entry.get("seen", 1), 1)
+
+    def source_yield(self, url: str, prior: float = 0.1) -> float:
+        entry = self.sources.get(url)
+        if not entry or not entry.get("parsed"):
+            return prior
+        if "yield_ema" in entry:
+            return entry["yield_ema"]
+        return entry.get("alive", 0) / entry["parsed"]
+
+    @staticmethod
+    def _ema(prev: Optional[float], value: float) -> float:
+        return value if prev is None else (1 - SOURCE_EMA) * prev + SOURCE_EMA * value
+
+    def _record_source(self, url: str, m: dict):
+        prev = self.sources.get(url, {})
+        checked = max(m.get("parsed", 0) - m.get("capped", 0), 1)
+        entry = {
+            "parsed": m.get("parsed", 0),
+            "alive": m.get("alive", 0),
+            "runs": prev.get("runs", 0) + 1,
+            "yield_ema": round(self._ema(prev.get("yield_ema"), m.get("alive", 0) / checked), 4),
+        }
+        if m.get("fetch_sec") is not None:
+            entry["fetch_ema"] = round(self._ema(prev.get("fetch_ema"), m["fetch_sec"]), 2)
+        elif "fetch_ema" in prev:
+            entry["fetch_ema"] = prev["fetch_ema"]
+
+        if "unique" in m:
+            listed = max(m.get("listed", 0), 1)
+            entry["listed"] = m.get("listed", 0)
+            entry["unique"] = m["unique"]
+            entry["unique_ema"] = round(self._ema(prev.get("unique_ema"), m["unique"] / listed), 4)
+            duplicate_only = m.get("alive_listed", 0) > 0 and m["unique"] == 0
+            entry["dup_streak"] = prev.get("dup_streak", 0) + 1 if duplicate_only else 0
+        else:
+            for key in ("listed", "unique", "unique_ema", "dup_streak"):
+                if key in prev:
+                    entry[key] = prev[key]
+        self.sources[url] = entry
+
+    def record_run(self, checked_ids: Iterable[str], alive: List[ProxyNode], source_metrics: Dict[str, dict]):
+        now = time.time()
+        alive_ids = {n.strict_id for n in alive}
+
+        for sid in checked_ids:
+            entry = self.nodes.get(sid)
+            if sid in alive_ids:
+                if entry is None:
+                    entry = self.nodes[sid] = {"ok": 0, "seen": 0}
+                entry["ok"] += 1
+                entry["last_ok"] = now
+            if entry is not None:
+                entry["seen"] += 1
+
+        self.nodes = {
+            sid: e for sid, e in self.nodes.items()
+            if now - e.get("last_ok", 0) < NODE_TTL
+        }
+
+        for url, m in source_metrics.items():
+            if m.get("parsed", 0) > 0 or m.get("listed", 0) > 0:
+                self._record_source(url, m)
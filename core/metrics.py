@@ -0,0 +1,156 @@
+import bisect
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+from loguru import logger
+
+PREFIX = "sunny_"
+
+BUCKETS: Dict[str, List[float]] = {
+    "source_fetch_seconds": [0.25, 0.5, 1, 2, 5, 10, 20, 40],
+    "config_check_seconds": [0.05, 0.1, 0.25, 0.5, 1, 2, 5],
+    "singbox_startup_seconds": [0.1, 0.25, 0.5, 1, 2, 4, 8],
+    "ping_latency_ms": [100, 250, 500, 1000, 2000, 3000, 5000, 8000],
+    "speed_mbps": [1, 5, 10, 25, 50, 100, 250, 500, 1000],
+    "batch_seconds": [5, 10, 20, 40, 60, 90, 120, 180, 240],
+}
+DEFAULT_BUCKETS = [0.01, 0.1, 1, 10, 100, 1000]
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {"bounds": self.bounds, "counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def merge(self, data: dict):
+        if data["bounds"] != self.bounds:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.sum += data["sum"]
+        self.count += data["count"]
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _key(labels)
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram(BUCKETS.get(name, DEFAULT_BUCKETS))
+        hist.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": {n: [[list(k), v] for k, v in s.items()] for n, s in self.counters.items()},
+            "gauges": {n: [[list(k), v] for k, v in s.items()] for n, s in self.gauges.items()},
+            "histograms": {n: [[list(k), h.to_dict()] for k, h in s.items()] for n, s in self.histograms.items()},
+        }
+
+    def merge(self, snapshot: dict):
+        for name, series in snapshot.get("counters", {}).items():
+            for key, value in series:
+                self.inc(name, value, **dict(key))
+        for name, series in snapshot.get("gauges", {}).items():
+            for key, value in series:
+                self.set(name, value, **dict(key))
+        for name, series in snapshot.get("histograms", {}).items():
+            target = self.histograms.setdefault(name, {})
+            for key, data in series:
+                k = _key(dict(key))
+                if k not in target:
+                    target[k] = Histogram(data["bounds"])
+                target[k].merge(data)
+
+    def drain(self) -> dict:
+        snap = self.snapshot()
+        self.reset()
+        return snap
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: str = "") -> str:
+        parts = ['%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in key]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in series.items():
+                lines.append(f"{PREFIX}{name}{self._labels(key)} {value:g}")
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for key, value in series.items():
+                lines.append(f"{PREFIX}{name}{self._labels(key)} {value:g}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, hist in series.items():
+                cumulative = 0
+                for bound, count in zip(hist.bounds + [float("inf")], hist.counts):
+                    cumulative += count
+                    le = 'le="%s"' % ("+Inf" if bound == float("inf") else f"{bound:g}")
+                    lines.append(f"{PREFIX}{name}_bucket{self._labels(key, le)} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{self._labels(key)} {hist.sum:g}")
+                lines.append(f"{PREFIX}{name}_count{self._labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str = "data"):
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, "metrics.json"), "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False)
+            with open(os.path.join(directory, "metrics.prom"), "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            logger.info(f"📈 Метрики сохранены: {directory}/metrics.json, {directory}/metrics.prom")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения метрик: {e}")
+
+
+METRICS = Metrics()
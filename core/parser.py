@@ -6,13 +6,15 @@ import re
 import html
 import asyncio
 import hashlib
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Set
 import aiohttp
 
 from core.models import ProxyNode, ProxyConfig
 from core.logger import logger
 from core.settings import CONFIG
 from core.validator import RKNValidator
+from core.metrics import METRICS
 
 SS_VALID_METHODS = {
     "aes-128-gcm", "aes-192-gcm", "aes-256-gcm", 
@@ -38,6 +40,7 @@ class LinkParser:
     def __init__(self):
         self.semaphore = asyncio.Semaphore(15)
         self.metrics = {}
+        self.node_sources: Dict[str, Set[str]] = {}
         self._seen_content_hashes: set = set()
 
     @staticmethod
@@ -311,44 +314,57 @@ class LinkParser:
 
     async def _fetch_url_with_retry(self, session: aiohttp.ClientSession, url: str, retries: int = 3) -> str:
         async with self.semaphore:
-            for attempt in range(retries):
-                try:
-                    timeout = aiohttp.ClientTimeout(total=20)
-                    async with session.get(url, timeout=timeout) as resp:
-                        if resp.status == 200:
-                            self.metrics[url] = {"parsed": 0, "alive": 0, "status": "OK"}
-                            return await resp.text(errors='ignore')
-                        if resp.status == 429:
-                            if attempt < retries - 1:
-                                await asyncio.sleep(2 ** attempt)
-                                continue
-                            self.metrics[url] = {"parsed": 0, "alive": 0, "status": "429 Rate Limited"}
+            t0 = time.perf_counter()
+            try:
+                for attempt in range(retries):
+                    try:
+                        timeout = aiohttp.ClientTimeout(total=20)
+                        async with session.get(url, timeout=timeout) as resp:
+                            if resp.status == 200:
+                                self.metrics[url] = {"parsed": 0, "alive": 0, "status": "OK"}
+                                return await resp.text(errors='ignore')
+                            if resp.status == 429:
+                                if attempt < retries - 1:
+                                    await asyncio.sleep(2 ** attempt)
+                                    continue
+                                self.metrics[url] = {"parsed": 0, "alive": 0, "status": "429 Rate Limited"}
+                                return ""
+                            self.metrics[url] = {"parsed": 0, "alive": 0, "status": f"HTTP {resp.status}"}
                             return ""
-                        self.metrics[url] = {"parsed": 0, "alive": 0, "status": f"HTTP {resp.status}"}
-                        return ""
-                except Exception as e:
-                    if attempt < retries - 1:
-                        await asyncio.sleep(2 ** attempt)
-                        continue
-                    self.metrics[url] = {"parsed": 0, "alive": 0, "status": f"Error: {str(e)[:60]}"}
-            return ""
-
-    async def fetch_and_parse(self) -> List[ProxyNode]:
+                    except Exception as e:
+                        if attempt < retries - 1:
+                            await asyncio.sleep(2 ** attempt)
+                            continue
+                        self.metrics[url] = {"parsed": 0, "alive": 0, "status": f"Error: {str(e)[:60]}"}
+                return ""
+            finally:
+                elapsed = time.perf_counter() - t0
+                METRICS.observe("source_fetch_seconds", elapsed)
+                if url in self.metrics:
+                    self.metrics[url]["fetch_sec"] = round(elapsed, 2)
+
+    @staticmethod
+    def source_list() -> List[str]:
+        raw_sources = CONFIG.SUBSCRIPTION_SOURCES
+        if not raw_sources: 
+            return[]
+
+        if isinstance(raw_sources, list):
+            return list(dict.fromkeys(s.strip() for s in raw_sources if s.strip()))
+        return list(dict.fromkeys(s.strip() for s in raw_sources.splitlines() if s.strip()))
+
+    async def fetch_and_parse(self, sources: Optional[List[str]] = None) -> List[ProxyNode]:
         nodes: List[ProxyNode] =[]
         seen_ids: set = set()
         machine_counts: dict = {}
         
         max_accounts_per_server = CONFIG.parser.get("max_accounts_per_server", 5)
 
-        raw_sources = CONFIG.SUBSCRIPTION_SOURCES
-        if not raw_sources: 
+        if sources is None:
+            sources = self.source_list()
+        if not sources: 
             return[]
 
-        if isinstance(raw_sources, list):
-            sources = list(dict.fromkeys(s.strip() for s in raw_sources if s.strip()))
-        else:
-            sources = list(dict.fromkeys(s.strip() for s in raw_sources.splitlines() if s.strip()))
-
         logger.info(f"⭳ Загрузка {len(sources)} источников...")
 
         connector = aiohttp.TCPConnector(limit=15, ttl_dns_cache=300)
@@ -364,6 +380,7 @@ class LinkParser:
             "hysteria2://": self.parse_hy2,
         }
 
+        parse_started = time.perf_counter()
         for i, content in enumerate(results):
             if not content: continue
             url = sources[i]
@@ -393,6 +410,7 @@ class LinkParser:
                         if node.config.security in ("none", "") and node.config.type not in ("ws", "httpupgrade", "xhttp"):
                             continue
 
+                    self.node_sources.setdefault(node.strict_id, set()).add(url)
                     if node.strict_id not in seen_ids:
                         m_id = node.machine_id
                         
@@ -407,6 +425,11 @@ class LinkParser:
             if url in self.metrics:
                 self.metrics[url]["parsed"] = nodes_from_source
 
+        parse_elapsed = max(time.perf_counter() - parse_started, 1e-6)
+        METRICS.inc("parsed_nodes_total", len(nodes))
+        METRICS.set("parse_seconds", parse_elapsed)
+        METRICS.set("parse_rate_nodes_per_second", len(nodes) / parse_elapsed)
+
         logger.info("📊 Статистика парсинга источников:")
         for url, stat in self.metrics.items():
             if stat["parsed"] > 0:
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import socket
+import ssl
+import time
+from typing import Dict, List, Tuple
+from loguru import logger
+
+from core.settings import CONFIG
+from core.models import ProxyNode
+from core.metrics import METRICS
+from core.controller import fd_limit
+
+UDP_PROTOCOLS = {"hysteria2"}
+UDP_TRANSPORTS = {"quic"}
+
+
+class Prefilter:
+    def __init__(self):
+        cfg = CONFIG.prefilter
+        self.enabled = bool(cfg.get("enabled", True))
+        self.timeout = float(cfg.get("timeout", 3.0))
+        self.tls = bool(cfg.get("tls_handshake", True))
+        self.tls_timeout = float(cfg.get("tls_timeout", 4.0))
+        self.concurrency = max(1, min(int(cfg.get("concurrency", 2000)), fd_limit() // 2))
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._dns: Dict[str, asyncio.Future] = {}
+        self._tcp: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._ssl = ssl.create_default_context()
+        self._ssl.check_hostname = False
+        self._ssl.verify_mode = ssl.CERT_NONE
+
+    async def _resolve(self, host: str) -> str:
+        fut = self._dns.get(host)
+        if fut is None:
+            fut = self._dns[host] = asyncio.ensure_future(self._do_resolve(host))
+        return await fut
+
+    @staticmethod
+    async def _do_resolve(host: str) -> str:
+        try:
+            socket.inet_pton(socket.AF_INET6 if ":" in host else socket.AF_INET, host.strip("[]"))
+            return host.strip("[]")
+        except OSError:
+            pass
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return infos[0][4][0]
+
+    async def _tcp_probe(self, host: str, port: int) -> str:
+        key = (host, port)
+        fut = self._tcp.get(key)
+        if fut is None:
+            fut = self._tcp[key] = asyncio.ensure_future(self._do_tcp_probe(host, port))
+        return await fut
+
+    async def _do_tcp_probe(self, host: str, port: int) -> str:
+        try:
+            addr = await asyncio.wait_for(self._resolve(host), timeout=self.timeout)
+        except Exception:
+            return "dns"
+
+        async with self._semaphore:
+            writer = None
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(addr, port), timeout=self.timeout)
+                return "ok"
+            except asyncio.TimeoutError:
+                return "timeout"
+            except OSError:
+                return "refused"
+            finally:
+                if writer:
+                    writer.close()
+                    with contextlib.suppress(Exception):
+                        await asyncio.wait_for(writer.wait_closed(), timeout=self.timeout)
+
+    async def _tls_probe(self, host: str, port: int, sni: str) -> str:
+        async with self._semaphore:
+            writer = None
+            try:
+                addr = await self._resolve(host)
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(addr, port, ssl=self._ssl, server_hostname=sni or None),
+                    timeout=self.tls_timeout,
+                )
+                return "ok"
+            except ssl.SSLError:
+                return "ok"
+            except asyncio.TimeoutError:
+                return "tls_timeout"
+            except OSError:
+                return "tls_reset"
+            finally:
+                if writer:
+                    writer.close()
+                    with contextlib.suppress(Exception):
+                        await asyncio.wait_for(writer.wait_closed(), timeout=self.timeout)
+
+    async def _probe_machine(self, node: ProxyNode) -> str:
+        cfg = node.config
+        status = await self._tcp_probe(cfg.server, cfg.port)
+        if status != "ok" or not self.tls or cfg.security not in ("tls", "reality"):
+            return status
+        return await self._tls_probe(cfg.server, cfg.port, cfg.sni or cfg.host or cfg.server)
+
+    async def run(self, nodes: List[ProxyNode]) -> Tuple[List[ProxyNode], List[ProxyNode]]:
+        if not self.enabled or not nodes:
+            return nodes, []
+
+        t0 = time.perf_counter()
+        machines: Dict[str, List[ProxyNode]] = {}
+        skipped: List[ProxyNode] = []
+        for node in nodes:
+            if node.protocol in UDP_PROTOCOLS or node.config.type in UDP_TRANSPORTS:
+                skipped.append(node)
+            else:
+                machines.setdefault(node.machine_id, []).append(node)
+
+        logger.info(f"⚡ Префильтр: {len(machines)} машин ({len(nodes)} узлов), до {self.concurrency} соединений, таймаут {self.timeout:g}с")
+        keys = list(machines)
+        results = await asyncio.gather(*[
+            self._probe_machine(next((n for n in machines[k] if n.config.security in ("tls", "reality")), machines[k][0]))
+            for k in keys
+        ], return_exceptions=True)
+
+        reachable = list(skipped)
+        dropped: List[ProxyNode] = []
+        stats: Dict[str, int] = {}
+        for key, res in zip(keys, results):
+            status = res if isinstance(res, str) else "error"
+            stats[status] = stats.get(status, 0) + 1
+            METRICS.inc("prefilter_machines_total", result=status)
+            (reachable if status == "ok" else dropped).extend(machines[key])
+
+        elapsed = time.perf_counter() - t0
+        METRICS.observe("prefilter_seconds", elapsed)
+        METRICS.inc("prefilter_dropped_nodes_total", len(dropped))
+        details = " | ".join(f"{k}: {v}" for k, v in sorted(stats.items()))
+        logger.success(f"⚡ Префильтр за {elapsed:.1f}с: осталось {len(reachable)}, отсечено {len(dropped)} узлов ({details})")
+        return reachable, dropped
@@ -0,0 +1,147 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from loguru import logger
+
+_SPAN_PATH: contextvars.ContextVar = contextvars.ContextVar("profile_span_path", default=())
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, target_ident: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target_ident = target_ident
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.self_time: Counter = Counter()
+        self._stop_event = threading.Event()
+        try:
+            self._clock = time.pthread_getcpuclockid(target_ident)
+        except (AttributeError, OSError):
+            self._clock = None
+
+    def _cpu(self) -> float:
+        if self._clock is None:
+            return time.monotonic()
+        return time.clock_gettime(self._clock)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        return f"{module}:{code.co_name}"
+
+    def run(self):
+        last_cpu = self._cpu()
+        while not self._stop_event.wait(self.interval):
+            cpu = self._cpu()
+            spent_us = int((cpu - last_cpu) * 1_000_000)
+            last_cpu = cpu
+            if spent_us <= 0:
+                continue
+            frame = sys._current_frames().get(self.target_ident)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack.reverse()
+            self.stacks[";".join(stack)] += spent_us
+            self.self_time[stack[-1]] += spent_us
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2.0)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[Tuple[Tuple[str, ...], float]] = []
+        self._sampler: Optional[_Sampler] = None
+        self._started = 0.0
+
+    def enable(self, sample_interval: float = 0.0):
+        self.enabled = True
+        self._started = time.perf_counter()
+        if sample_interval > 0:
+            self._sampler = _Sampler(threading.get_ident(), sample_interval)
+            self._sampler.start()
+        logger.info(f"⏲ Профилирование включено (спаны{', сэмплер CPU ' + str(int(sample_interval * 1000)) + ' мс' if self._sampler else ''})")
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        path = _SPAN_PATH.get() + (name,)
+        token = _SPAN_PATH.set(path)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((path, time.perf_counter() - t0))
+            _SPAN_PATH.reset(token)
+
+    def _folded_spans(self) -> List[str]:
+        total = {}
+        children = {}
+        for path, dur in self.spans:
+            total[path] = total.get(path, 0.0) + dur
+            if len(path) > 1:
+                children[path[:-1]] = children.get(path[:-1], 0.0) + dur
+        lines = []
+        for path, dur in total.items():
+            self_ms = int(max(dur - children.get(path, 0.0), 0.0) * 1000)
+            if self_ms > 0:
+                lines.append(f"{';'.join(path)} {self_ms}")
+        return sorted(lines)
+
+    def finish(self, directory: str = "data", top_n: int = 15):
+        if not self.enabled:
+            return
+        if self._sampler:
+            self._sampler.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        wall = time.perf_counter() - self._started
+        report = [f"Wall time: {wall:.2f}s", "", f"Top {top_n} slowest spans:"]
+
+        slowest = sorted(self.spans, key=lambda s: s[1], reverse=True)
+        for path, dur in slowest[:top_n]:
+            report.append(f"  {dur:8.2f}s  {' > '.join(path)}")
+
+        batches = [s for s in slowest if s[0][-1].startswith("batch-")]
+        report += ["", f"Top {top_n} slowest batches:"]
+        for path, dur in batches[:top_n]:
+            report.append(f"  {dur:8.2f}s  {path[-1]}")
+
+        try:
+            with open(os.path.join(directory, "profile_spans.folded"), "w", encoding="utf-8") as f:
+                f.write("\n".join(self._folded_spans()) + "\n")
+
+            if self._sampler:
+                cpu_total = sum(self._sampler.self_time.values()) or 1
+                report += ["", f"Top {top_n} functions by event-loop CPU (self):"]
+                for name, us in self._sampler.self_time.most_common(top_n):
+                    report.append(f"  {us / 1_000_000:8.2f}s  {us * 100 / cpu_total:5.1f}%  {name}")
+                with open(os.path.join(directory, "profile_cpu.folded"), "w", encoding="utf-8") as f:
+                    f.write("\n".join(f"{stack} {us}" for stack, us in self._sampler.stacks.items()) + "\n")
+
+            with open(os.path.join(directory, "profile_report.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(report) + "\n")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения профиля: {e}")
+            return
+
+        logger.info("⏲ Профиль:\n" + "\n".join(report[:top_n + 3]))
+        logger.info(f"⏲ Профиль сохранён: {directory}/profile_spans.folded, {directory}/profile_report.txt"
+                    f"{', ' + directory + '/profile_cpu.folded' if self._sampler else ''}")
+
+
+PROFILER = Profiler()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+from loguru import logger
+
+from core.settings import CONFIG
+from core.models import ProxyNode
+from core.engine import BatchEngine, Inspector, BATCH_HARD_TIMEOUT, NODE_DEADLINE_MARGIN, GEO_LOOKUP_TIMEOUT, PING_TIMEOUT, SPEED_TIMEOUT
+from core.history import RunHistory
+from core.trace import Trace, TRACE_PATH
+
+
+class ReplayEngine(BatchEngine):
+    def __init__(self, trace: Trace, speedup: float = 1.0):
+        super().__init__()
+        self.trace = trace
+        self.speedup = max(float(speedup), 0.001)
+        self.hard_timeout = BATCH_HARD_TIMEOUT / self.speedup
+        self.deadline_margin = NODE_DEADLINE_MARGIN / self.speedup
+
+    async def _sleep(self, seconds: float):
+        if seconds > 0:
+            await asyncio.sleep(seconds / self.speedup)
+
+    async def _prepare_batch(self, nodes: List[ProxyNode], base_port: int, clash_secret: Optional[str] = None) -> Tuple[List[ProxyNode], Optional[dict]]:
+        await self._sleep(self.trace.check_per_node * len(nodes))
+        nodes = [n for n in nodes if self.trace.valid.get(n.strict_id, True)]
+        if not nodes:
+            return nodes, None
+        return nodes, {
+            "ports": [base_port + i for i in range(len(nodes))],
+            "indices": list(range(len(nodes))),
+            "ids": [n.strict_id for n in nodes],
+            "controller": None,
+        }
+
+    async def _start_singbox(self, config_data: dict, report: dict):
+        startup = self.trace.startup_per_node * len(config_data["ids"])
+        await self._sleep(startup)
+        if not any(self.trace.started.get(sid, True) for sid in config_data["ids"]):
+            return None, False
+        report["startup"] = startup
+        return None, True
+
+    async def _ping_phase(self, node: ProxyNode, port: int, delay_sec: float) -> dict:
+        await self._sleep(delay_sec)
+        async with self.ping_semaphore:
+            out = self.trace.next_outcome("ping", node.strict_id) or {"status": "timeout", "elapsed": PING_TIMEOUT}
+            await self._sleep(out.get("elapsed", 0.0))
+        if out["status"] == "ok":
+            return {"status": "ok", "node": node, "port": port, "latency": out["latency"], "endpoint": out.get("endpoint")}
+        return {k: v for k, v in out.items() if k in ("status", "permanent")}
+
+    async def _clash_ping_all(self, config_data: dict, nodes: List[ProxyNode], base_port: int) -> list:
+        return await asyncio.gather(*[
+            self._ping_phase(nodes[i], base_port + i, 0.0) for i in config_data["indices"]
+        ], return_exceptions=True)
+
+    async def _speed_phase(self, node_data: dict, is_champion: bool, deadline: Optional[float] = None, streams: int = 0) -> dict:
+        node = node_data["node"]
+        async with self.speed_semaphore:
+            if deadline is not None and time.monotonic() + (SPEED_TIMEOUT + GEO_LOOKUP_TIMEOUT) / self.speedup > deadline:
+                return {"status": "deferred", "node": node}
+            out = self.trace.next_outcome("speed", node.strict_id) or {"status": "drop", "elapsed": SPEED_TIMEOUT}
+            await self._sleep(out.get("elapsed", 0.0))
+
+        if out["status"] != "ok":
+            return {"status": out["status"]}
+        country = out.get("country", "UN")
+        if country != "UN":
+            BatchEngine._GEO_CACHE[node.config.server] = country
+        return {"status": "ok", "node": node.model_copy(update={"latency": node_data["latency"], "speed": out["speed"], "country": country})}
+
+
+async def run_replay(path: str = TRACE_PATH, speedup: float = 20.0) -> List[ProxyNode]:
+    trace = Trace.load(path)
+    CONFIG.workers["processes"] = 1
+    CONFIG.adaptive["target_batch_time"] = float(CONFIG.adaptive.get("target_batch_time", 60.0)) / speedup
+    CONFIG.scheduler["initial_batch_estimate"] = float(CONFIG.scheduler.get("initial_batch_estimate", 90.0)) / speedup
+
+    started = time.monotonic()
+    budget = CONFIG.scheduler.get("time_budget", 0)
+    deadline = started + (budget - CONFIG.scheduler.get("reserve", 180)) / speedup if budget else None
+
+    inspector = Inspector(RunHistory())
+    inspector.batch_engine = ReplayEngine(trace, speedup)
+    alive = await inspector.process_all(list(trace.nodes.values()), deadline=deadline)
+
+    elapsed = time.monotonic() - started
+    logger.success(
+        f"▶ Реплей: живых {len(alive)}/{len(trace.nodes)} (в записи {len(trace.alive_ids)}), "
+        f"модельное время ≈{elapsed * speedup:.0f}s за {elapsed:.1f}s (×{speedup:g})"
+    )
+    return alive
@@ -0,0 +1,49 @@
+import time
+from typing import List, Optional
+from loguru import logger
+
+from core.models import ProxyNode
+from core.history import RunHistory
+from core.sources import SourceScorer
+from core.settings import CONFIG
+
+
+class DeadlineScheduler:
+    def __init__(self, history: RunHistory, deadline: Optional[float] = None):
+        cfg = CONFIG.scheduler
+        self.history = history
+        self.sources = SourceScorer(history)
+        self.deadline = deadline
+        self.batch_estimate = float(cfg.get("initial_batch_estimate", 90.0))
+        self.ema_alpha = float(cfg.get("ema_alpha", 0.3))
+        self.w_known = float(cfg.get("weight_known_good", 10.0))
+        self.w_bs = float(cfg.get("weight_bs", 4.0))
+        self.w_reality = float(cfg.get("weight_reality", 1.0))
+        self.w_source = float(cfg.get("weight_source_yield", 5.0))
+
+    def score(self, node: ProxyNode) -> float:
+        s = self.w_known * self.history.node_ratio(node)
+        if node.is_bs:
+            s += self.w_bs
+        if node.config.security == "reality":
+            s += self.w_reality
+        s += self.w_source * self.sources.score(node.source_url)
+        return s
+
+    def order(self, nodes: List[ProxyNode]) -> List[ProxyNode]:
+        ranked = sorted(nodes, key=self.score, reverse=True)
+        known = sum(1 for n in nodes if self.history.node_ratio(n) > 0)
+        logger.info(f"⇅ Планировщик: {known} узлов из истории в приоритете, BS: {sum(1 for n in nodes if n.is_bs)}")
+        return ranked
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def admit(self) -> bool:
+        left = self.remaining()
+        return left is None or self.batch_estimate <= left
+
+    def observe(self, duration: float):
+        self.batch_estimate = (1 - self.ema_alpha) * self.batch_estimate + self.ema_alpha * duration
@@ -36,6 +36,14 @@ class AppSettings(BaseSettings):
             "http://www.gstatic.com/generate_204",
             "http://cp.cloudflare.com/generate_204"
         ],
+        "ping_backend": "socks",
+        "config_transport": "stdin",
+        "hedge_delay": 1.0,
+        "speed_streams": 1,
+        "champion_streams": 4,
+        "speed_endpoints":[],
+        "multistream_top": 50,
+        "multistream_concurrency": 2,
     })
     
     app: dict = Field(default_factory=lambda: {
@@ -44,11 +52,88 @@ class AppSettings(BaseSettings):
         "channel_tag": "@SunnyAreral",
     })
     
+    export: dict = Field(default_factory=lambda: {
+        "precompress":["gzip", "br"],
+        "tiers": {"top": 50, "per_country": 20, "per_protocol": 50},
+        "speed_buckets":[100, 50, 20, 10, 5],
+    })
+    
     whitelist: dict = Field(default_factory=lambda: {
         "domains_url": "https://raw.githubusercontent.com/whoahaow/rjsxrd/refs/heads/main/source/config/whitelist-all.txt",
         "ips_url": "https://raw.githubusercontent.com/whoahaow/rjsxrd/refs/heads/main/source/config/cidrwhitelist.txt",
     })
 
+    scheduler: dict = Field(default_factory=lambda: {
+        "time_budget": 3000,
+        "reserve": 180,
+        "initial_batch_estimate": 90.0,
+        "ema_alpha": 0.3,
+        "weight_known_good": 10.0,
+        "weight_bs": 4.0,
+        "weight_reality": 1.0,
+        "weight_source_yield": 5.0,
+    })
+
+    adaptive: dict = Field(default_factory=lambda: {
+        "enabled": True,
+        "min_batch_size": 25,
+        "max_batch_size": 250,
+        "min_concurrency": 2,
+        "max_concurrency": 12,
+        "initial_concurrency": 0,
+        "target_batch_time": 60.0,
+        "window": 3,
+    })
+
+    workers: dict = Field(default_factory=lambda: {
+        "processes": 1,
+        "jobs_per_worker": 3,
+    })
+
+    serve: dict = Field(default_factory=lambda: {
+        "host": "0.0.0.0",
+        "port": 8080,
+        "source_interval": 3600,
+        "source_intervals": {},
+        "alive_recheck": 1200,
+        "dead_recheck": 7200,
+        "tick": 5,
+    })
+
+    sources: dict = Field(default_factory=lambda: {
+        "prior_score": 0.1,
+        "min_runs": 3,
+        "low_yield": 0.02,
+        "low_yield_cap": 50,
+        "weight_unique": 2.0,
+        "weight_fetch_latency": 0.005,
+        "duplicate_runs": 2,
+    })
+
+    prefilter: dict = Field(default_factory=lambda: {
+        "enabled": True,
+        "concurrency": 2000,
+        "timeout": 3.0,
+        "tls_handshake": True,
+        "tls_timeout": 4.0,
+    })
+
+    two_tier: dict = Field(default_factory=lambda: {
+        "enabled": False,
+        "ping_batch_size": 1000,
+        "ping_concurrency": 2,
+        "bandwidth_mbps": 400,
+        "node_mbps": 40,
+        "speed_batch_time": 60,
+        "speed_concurrency": 2,
+    })
+
+    retry: dict = Field(default_factory=lambda: {
+        "enabled": True,
+        "batch_size": 30,
+        "concurrency": 2,
+    })
+
     BATCH_SIZE: int = 100
 
     @classmethod
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Set, Tuple
+from loguru import logger
+
+from core.models import ProxyNode
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    try:
+        index, total = (int(x) for x in spec.split("/", 1))
+    except ValueError:
+        raise ValueError(f"Некорректный шард '{spec}', ожидается формат i/N")
+    if total < 1 or not 1 <= index <= total:
+        raise ValueError(f"Некорректный шард '{spec}': нужно 1 <= i <= N")
+    return index, total
+
+
+def shard_of(node: ProxyNode, total: int) -> int:
+    return shard_of_id(node.strict_id, total)
+
+
+def shard_of_id(strict_id: str, total: int) -> int:
+    digest = hashlib.md5(strict_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % total + 1
+
+
+def select_shard(nodes: List[ProxyNode], index: int, total: int) -> List[ProxyNode]:
+    selected = [n for n in nodes if shard_of(n, total) == index]
+    logger.info(f"⧉ Шард {index}/{total}: {len(selected)} из {len(nodes)} узлов")
+    return selected
+
+
+def default_partial_path(index: int, total: int) -> str:
+    return f"data/shard_{index}of{total}.json"
+
+
+def default_checkpoint_path(index: int, total: int) -> str:
+    return f"data/checkpoint_{index}of{total}.jsonl"
+
+
+def write_partial(path: str, spec: str, nodes: List[ProxyNode], checked_ids: List[str], alive: List[ProxyNode], metrics: dict, node_sources: Dict[str, Set[str]]):
+    index, total = parse_shard_spec(spec)
+    shard_metrics = {}
+    for url, m in metrics.items():
+        shard_metrics[url] = {"parsed": 0, "alive": 0, "status": m.get("status", "OK")}
+        if m.get("fetch_sec") is not None:
+            shard_metrics[url]["fetch_sec"] = m["fetch_sec"]
+    for node in nodes:
+        m = shard_metrics.setdefault(node.source_url, {"parsed": 0, "alive": 0, "status": metrics.get(node.source_url, {}).get("status", "OK")})
+        m["parsed"] += 1
+    for node in alive:
+        if node.source_url in shard_metrics:
+            shard_metrics[node.source_url]["alive"] += 1
+
+    payload = {
+        "shard": spec,
+        "parsed": len(nodes),
+        "checked": checked_ids,
+        "alive": [n.model_dump() for n in alive],
+        "metrics": shard_metrics,
+        "sources": {sid: sorted(urls) for sid, urls in node_sources.items() if shard_of_id(sid, total) == index},
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.success(f"⧉ Частичный результат шарда {spec}: {len(alive)} живых → {path}")
+
+
+def load_partials(paths: List[str]) -> Tuple[int, List[str], List[ProxyNode], dict, Dict[str, Set[str]]]:
+    total_parsed = 0
+    checked: List[str] = []
+    alive: dict = {}
+    metrics: dict = {}
+    node_sources: Dict[str, Set[str]] = {}
+
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            logger.error(f"Не удалось прочитать {path}: {e}")
+            continue
+
+        total_parsed += payload.get("parsed", 0)
+        checked.extend(payload.get("checked", []))
+        for raw in payload.get("alive", []):
+            node = ProxyNode.model_validate(raw)
+            alive.setdefault(node.strict_id, node)
+        for url, m in payload.get("metrics", {}).items():
+            agg = metrics.setdefault(url, {"parsed": 0, "alive": 0, "status": m.get("status", "OK")})
+            agg["parsed"] += m.get("parsed", 0)
+            agg["alive"] += m.get("alive", 0)
+            if m.get("fetch_sec") is not None:
+                agg.setdefault("fetch_sec", m["fetch_sec"])
+        for sid, urls in payload.get("sources", {}).items():
+            node_sources.setdefault(sid, set()).update(urls)
+        logger.info(f"⧉ {path}: шард {payload.get('shard', '?')}, живых {len(payload.get('alive', []))}")
+
+    return total_parsed, checked, list(alive.values()), metrics, node_sources
@@ -0,0 +1,89 @@
+from typing import Dict, List, Set
+from loguru import logger
+
+from core.settings import CONFIG
+from core.models import ProxyNode
+from core.history import RunHistory
+from core.metrics import METRICS
+
+
+class SourceScorer:
+    def __init__(self, history: RunHistory):
+        cfg = CONFIG.sources
+        self.history = history
+        self.prior = float(cfg.get("prior_score", 0.1))
+        self.min_runs = int(cfg.get("min_runs", 3))
+        self.low_yield = float(cfg.get("low_yield", 0.02))
+        self.low_yield_cap = int(cfg.get("low_yield_cap", 50))
+        self.w_unique = float(cfg.get("weight_unique", 2.0))
+        self.w_latency = float(cfg.get("weight_fetch_latency", 0.005))
+        self.duplicate_runs = int(cfg.get("duplicate_runs", 2))
+
+    def _known(self, url: str) -> dict:
+        entry = self.history.sources.get(url)
+        if not entry or entry.get("runs", 0) < self.min_runs:
+            return {}
+        return entry
+
+    def score(self, url: str) -> float:
+        entry = self._known(url)
+        if not entry:
+            return self.prior
+        return (
+            entry.get("yield_ema", 0.0)
+            + self.w_unique * entry.get("unique_ema", 0.0)
+            - self.w_latency * entry.get("fetch_ema", 0.0)
+        )
+
+    def order_sources(self, urls: List[str]) -> List[str]:
+        ordered = sorted(urls, key=self.score, reverse=True)
+        for url in ordered:
+            METRICS.set("source_score", round(self.score(url), 4), source=url)
+        return ordered
+
+    def is_low_yield(self, url: str) -> bool:
+        entry = self._known(url)
+        return bool(entry) and entry.get("yield_ema", 0.0) < self.low_yield
+
+    def cap(self, nodes: List[ProxyNode], metrics: Dict[str, dict]) -> List[ProxyNode]:
+        if self.low_yield_cap <= 0:
+            return nodes
+
+        by_source: Dict[str, List[ProxyNode]] = {}
+        for node in nodes:
+            if self.is_low_yield(node.source_url):
+                by_source.setdefault(node.source_url, []).append(node)
+
+        dropped: Set[str] = set()
+        for url, group in by_source.items():
+            if len(group) <= self.low_yield_cap:
+                continue
+            group.sort(key=self.history.node_ratio, reverse=True)
+            extra = group[self.low_yield_cap:]
+            dropped.update(n.strict_id for n in extra)
+            if url in metrics:
+                metrics[url]["capped"] = len(extra)
+
+        if not dropped:
+            return nodes
+        logger.info(f"✂ Источники с низким выходом: {len(by_source)}, отложено {len(dropped)} узлов (лимит {self.low_yield_cap} на источник)")
+        return [n for n in nodes if n.strict_id not in dropped]
+
+    @staticmethod
+    def annotate(metrics: Dict[str, dict], node_sources: Dict[str, Set[str]], alive: List[ProxyNode]):
+        for m in metrics.values():
+            m.update(listed=0, alive_listed=0, unique=0)
+        for urls in node_sources.values():
+            for url in urls:
+                if url in metrics:
+                    metrics[url]["listed"] += 1
+        for node in alive:
+            urls = node_sources.get(node.strict_id) or {node.source_url}
+            for url in urls:
+                if url in metrics:
+                    metrics[url]["alive_listed"] += 1
+                    if len(urls) == 1:
+                        metrics[url]["unique"] += 1
+
+    def duplicate_sources(self) -> List[str]:
+        return [url for url, e in self.history.sources.items() if e.get("dup_streak", 0) >= self.duplicate_runs]
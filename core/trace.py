@@ -0,0 +1,109 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from loguru import logger
+
+from core.models import ProxyNode
+
+TRACE_PATH = "data/trace.jsonl"
+
+
+class TraceRecorder:
+    def __init__(self):
+        self.enabled = False
+        self.path = TRACE_PATH
+        self.events: List[dict] = []
+
+    def enable(self, path: str = TRACE_PATH):
+        self.enabled = True
+        self.path = path
+        logger.info(f"⏺ Запись трассы прогона в {path}")
+
+    def record(self, kind: str, **fields):
+        if self.enabled:
+            fields["e"] = kind
+            self.events.append(fields)
+
+    def outcome(self, kind: str, node: ProxyNode, res: dict, t0: float) -> dict:
+        if self.enabled:
+            fields = {k: v for k, v in res.items() if k not in ("node", "port")}
+            if kind == "speed" and res.get("status") == "ok":
+                fields.update(speed=res["node"].speed, country=res["node"].country)
+            self.record(kind, id=node.strict_id, elapsed=round(time.perf_counter() - t0, 3), **fields)
+        return res
+
+    def drain(self) -> List[dict]:
+        events, self.events = self.events, []
+        return events
+
+    def extend(self, events: List[dict]):
+        if self.enabled:
+            self.events.extend(events)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                for event in self.events:
+                    f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+            logger.info(f"⏺ Трасса: {len(self.events)} событий → {self.path}")
+        except Exception as e:
+            logger.error(f"Ошибка записи трассы {self.path}: {e}")
+
+
+class Trace:
+    def __init__(self):
+        self.nodes: Dict[str, ProxyNode] = {}
+        self.valid: Dict[str, bool] = {}
+        self.started: Dict[str, bool] = {}
+        self.outcomes: Dict[Tuple[str, str], Deque[dict]] = {}
+        self.alive_ids: Set[str] = set()
+        self.check_per_node = 0.0
+        self.startup_per_node = 0.0
+
+    @classmethod
+    def load(cls, path: str = TRACE_PATH) -> "Trace":
+        trace = cls()
+        batches: List[dict] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                kind = event.get("e")
+                if kind == "node":
+                    if event["id"] not in trace.nodes:
+                        trace.nodes[event["id"]] = ProxyNode.model_validate(event["node"])
+                    trace.valid[event["id"]] = trace.valid.get(event["id"], False) or event.get("valid", False)
+                elif kind == "batch":
+                    batches.append(event)
+                    for sid in event.get("ids", []):
+                        trace.started[sid] = trace.started.get(sid, False) or event.get("ready", False)
+                elif kind in ("ping", "speed"):
+                    trace.outcomes.setdefault((kind, event["id"]), deque()).append(event)
+                    if kind == "speed" and event.get("status") == "ok":
+                        trace.alive_ids.add(event["id"])
+
+        sized = sum(b.get("size", 0) for b in batches) or 1
+        trace.check_per_node = sum(b.get("check", 0.0) for b in batches) / sized
+        ready = [b for b in batches if b.get("ready")]
+        trace.startup_per_node = sum(b.get("startup", 0.0) for b in ready) / (sum(b.get("size", 0) for b in ready) or 1)
+        logger.info(
+            f"▶ Трасса {path}: {len(trace.nodes)} узлов, {len(batches)} батчей, "
+            f"{sum(len(q) for q in trace.outcomes.values())} исходов пинга/скорости"
+        )
+        return trace
+
+    def next_outcome(self, kind: str, node_id: str) -> Optional[dict]:
+        queue = self.outcomes.get((kind, node_id))
+        if not queue:
+            return None
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+
+RECORDER = TraceRecorder()
@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import multiprocessing
+import queue
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from core.models import ProxyNode
+from core.metrics import METRICS
+from core.trace import RECORDER
+
+PORT_LOW = 10000
+PORT_HIGH = 60000
+
+
+def port_ranges(workers: int) -> List[Tuple[int, int]]:
+    span = (PORT_HIGH - PORT_LOW) // (workers + 1)
+    return [(PORT_LOW + i * span, PORT_LOW + (i + 1) * span) for i in range(workers + 1)]
+
+
+def _worker_main(worker_id: int, port_range: Tuple[int, int], workers: int, jobs_per_worker: int, task_q, result_q, record: bool = False, speed_slots: int = 5):
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    RECORDER.enabled = record
+    try:
+        asyncio.run(_worker_loop(worker_id, port_range, workers, jobs_per_worker, task_q, result_q, speed_slots))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(worker_id: int, port_range: Tuple[int, int], workers: int, jobs_per_worker: int, task_q, result_q, speed_slots: int):
+    from core.engine import BatchEngine
+
+    BatchEngine.configure_ports(*port_range)
+    engine = BatchEngine()
+    engine.speed_semaphore = asyncio.Semaphore(max(1, speed_slots // workers))
+    loop = asyncio.get_running_loop()
+    inflight = asyncio.Semaphore(jobs_per_worker)
+    tasks = set()
+
+    async def run_job(job_id: int, raw_nodes: List[dict], batch_num: int, phase: str):
+        report = {"size": len(raw_nodes), "worker": worker_id}
+        alive: List[ProxyNode] = []
+        try:
+            nodes = [ProxyNode.model_validate(raw) for raw in raw_nodes]
+            alive = await engine.check_batch(nodes, batch_num=batch_num, report=report, phase=phase)
+        except Exception as e:
+            logger.error(f"Воркер {worker_id}: сбой батча {batch_num}: {e}")
+            report["failed"] = True
+        finally:
+            result_q.put({
+                "job": job_id,
+                "metrics": METRICS.drain(),
+                "trace": RECORDER.drain(),
+                "alive": [n.model_dump() for n in alive],
+                "report": report,
+                "geo": {n.config.server: n.country for n in alive if n.country != "UN"},
+            })
+            inflight.release()
+
+    while True:
+        await inflight.acquire()
+        job = await loop.run_in_executor(None, task_q.get)
+        if job is None:
+            break
+        job_id, raw_nodes, batch_num, geo, phase = job
+        BatchEngine._GEO_CACHE.update(geo)
+        task = asyncio.create_task(run_job(job_id, raw_nodes, batch_num, phase))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class WorkerPool:
+    def __init__(self, workers: int, jobs_per_worker: int = 3, speed_slots: int = 5):
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.task_q = ctx.Queue()
+        self.result_q = ctx.Queue()
+        ranges = port_ranges(workers)
+        self.local_ports = ranges[-1]
+        self.procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i + 1, ranges[i], workers, jobs_per_worker, self.task_q, self.result_q, RECORDER.enabled, speed_slots),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        self.geo_cache: Dict[str, str] = {}
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._job_ids = itertools.count(1)
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self):
+        for proc in self.procs:
+            proc.start()
+        self._reader = asyncio.create_task(self._read_results())
+        logger.info(f"⧉ Мультипроцесс: {self.workers} воркеров, порты {[r for r in port_ranges(self.workers)[:-1]]}")
+
+    def _poll(self) -> Optional[dict]:
+        try:
+            return self.result_q.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    async def _read_results(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            msg = await loop.run_in_executor(None, self._poll)
+            if msg is None:
+                if self._futures and not any(p.is_alive() for p in self.procs):
+                    for fut in self._futures.values():
+                        if not fut.done():
+                            fut.set_exception(RuntimeError("все воркеры завершились"))
+                    self._futures.clear()
+                continue
+            self.geo_cache.update(msg.get("geo", {}))
+            METRICS.merge(msg.get("metrics", {}))
+            RECORDER.extend(msg.get("trace", []))
+            fut = self._futures.pop(msg["job"], None)
+            if fut and not fut.done():
+                fut.set_result(msg)
+
+    async def run_batch(self, nodes: List[ProxyNode], batch_num: int, report: dict, phase: str = "full") -> List[ProxyNode]:
+        job_id = next(self._job_ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._futures[job_id] = fut
+        self.task_q.put((job_id, [n.model_dump() for n in nodes], batch_num, dict(self.geo_cache), phase))
+        msg = await fut
+        report.update(msg["report"])
+        return [ProxyNode.model_validate(raw) for raw in msg["alive"]]
+
+    async def close(self):
+        for _ in self.procs:
+            self.task_q.put(None)
+        loop = asyncio.get_running_loop()
+        for proc in self.procs:
+            await loop.run_in_executor(None, proc.join, 10.0)
+            if proc.is_alive():
+                proc.terminate()
+        if self._reader:
+            self._reader.cancel()
+            try: await self._reader
+            except (asyncio.CancelledError, Exception): pass
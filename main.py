@@ -1,67 +1,210 @@
+import argparse
 import asyncio
 import time
 import sys
+from typing import List, Optional
 from loguru import logger
 
 from core.settings import CONFIG
+from core.models import ProxyNode
 from core.parser import LinkParser
 from core.engine import Inspector
+from core.prefilter import Prefilter
 from core.exporter import Exporter
 from core.validator import RKNValidator
+from core.history import RunHistory
+from core.sources import SourceScorer
+from core.metrics import METRICS
+from core.profiler import PROFILER
+from core.trace import RECORDER, TRACE_PATH
+from core.replay import run_replay
+from core.shards import parse_shard_spec, select_shard, default_partial_path, default_checkpoint_path, write_partial, load_partials
+from core.checkpoint import Checkpoint, CHECKPOINT_PATH
+from core.daemon import ServeDaemon
 
-async def main():
+
+def report_dead_sources(metrics: dict) -> List[str]:
+    for url, m in metrics.items():
+        METRICS.set("source_parsed", m.get("parsed", 0), source=url)
+        METRICS.set("source_alive", m.get("alive", 0), source=url)
+        if m.get("fetch_sec") is not None:
+            METRICS.set("source_fetch_last_seconds", m["fetch_sec"], source=url)
+        if "unique" in m:
+            METRICS.set("source_unique_alive", m["unique"], source=url)
+
+    dead_sources =[url for url, m in metrics.items() if m.get("parsed", 0) > 0 and m.get("alive", 0) == 0]
+    
+    if dead_sources:
+        logger.warning("Источники, выдавшие 0 рабочих прокси после проверки:")
+        for src in dead_sources:
+            safe_src = src.replace("://", ":\u200b//").replace(".", ".\u200b")
+            logger.warning(f"   - {safe_src}")
+    return dead_sources
+
+
+def report_duplicate_sources(scorer: SourceScorer):
+    duplicates = scorer.duplicate_sources()
+    if duplicates:
+        logger.warning("Источники, которые несколько прогонов подряд дают только дубли чужих живых узлов:")
+        for src in duplicates:
+            safe_src = src.replace("://", ":\u200b//").replace(".", ".\u200b")
+            logger.warning(f"   - {safe_src}")
+
+
+async def publish(inspector: Inspector, total_parsed: int, alive_nodes: List[ProxyNode], dead_sources: List[str], start_time: float, deadline: Optional[float] = None):
+    if alive_nodes:
+        with PROFILER.span("champion_run"):
+            top_speed = await inspector.champion_run(alive_nodes, deadline=deadline)
+        alive_nodes.sort(key=lambda x: x.speed, reverse=True)
+        logger.info(f"⍟ Рекорд скорости: {top_speed} Mbps")
+        with PROFILER.span("export"):
+            Exporter.save_files(alive_nodes)
+    else:
+        logger.warning("⚠ Нет рабочих прокси. Файлы подписок НЕ перезаписаны.")
+
+    duration = time.perf_counter() - start_time
+    logger.info("Отправка Telegram отчета...")
+    
+    METRICS.set("run_seconds", duration)
+    METRICS.set("alive_nodes", len(alive_nodes))
+    METRICS.write()
+
+    with PROFILER.span("telegram"):
+        await Exporter.send_telegram_report(total_parsed, alive_nodes, duration, dead_sources)
+    logger.info(f"✔ Завершено за {duration:.2f} сек.")
+
+
+async def main(shard: Optional[str] = None, out: Optional[str] = None, resume: bool = False):
     start_time = time.perf_counter()
+    started = time.monotonic()
     logger.info("⏣ Запуск SunnyAreral Enterprise v13 (Hardcore Trace Mode)")
 
     try:
-        await RKNValidator.load_lists()
+        with PROFILER.span("load_lists"):
+            await RKNValidator.load_lists()
+
+        history = RunHistory.load()
+        scorer = SourceScorer(history)
 
         parser = LinkParser()
-        nodes = await parser.fetch_and_parse()
+        with PROFILER.span("fetch_and_parse"):
+            nodes = await parser.fetch_and_parse(scorer.order_sources(LinkParser.source_list()))
+        nodes = scorer.cap(nodes, parser.metrics)
+
+        if shard:
+            shard_index, shard_total = parse_shard_spec(shard)
+            nodes = select_shard(nodes, shard_index, shard_total)
 
         if not nodes:
             logger.error("✘ Нет валидных ссылок. Завершение.")
             sys.exit(0)
 
-        inspector = Inspector()
+        budget = CONFIG.scheduler.get("time_budget", 0)
+        deadline = started + budget - CONFIG.scheduler.get("reserve", 180) if budget else None
+
+        checkpoint = Checkpoint.open(default_checkpoint_path(shard_index, shard_total) if shard else CHECKPOINT_PATH, resume=resume)
+
+        with PROFILER.span("prefilter"):
+            reachable, unreachable = await Prefilter().run(nodes)
+
+        inspector = Inspector(history)
         logger.info("⚙ Пакетная проверка (Batch Engine)...")
 
-        alive_nodes = await inspector.process_all(nodes)
+        with PROFILER.span("process_all"):
+            alive_nodes = await inspector.process_all(reachable, deadline=deadline, checkpoint=checkpoint)
+        logger.success(f"⚑ Проверка завершена. Живых: {len(alive_nodes)}/{len(nodes)}")
+        checked_ids = [n.strict_id for n in inspector.checked_nodes + unreachable]
+
+        if shard:
+            write_partial(out or default_partial_path(shard_index, shard_total), shard, nodes, checked_ids, alive_nodes, parser.metrics, parser.node_sources)
+            METRICS.write(f"data/metrics_shard_{shard_index}of{shard_total}")
+            checkpoint.clear()
+            return
         
         for node in alive_nodes:
             if node.source_url in parser.metrics:
                 parser.metrics[node.source_url]["alive"] += 1
 
-        dead_sources =[url for url, m in parser.metrics.items() if m.get("parsed", 0) > 0 and m.get("alive", 0) == 0]
-        
-        if dead_sources:
-            logger.warning("Источники, выдавшие 0 рабочих прокси после проверки:")
-            for src in dead_sources:
-                safe_src = src.replace("://", ":\u200b//").replace(".", ".\u200b")
-                logger.warning(f"   - {safe_src}")
+        SourceScorer.annotate(parser.metrics, parser.node_sources, alive_nodes)
+        dead_sources = report_dead_sources(parser.metrics)
 
-        logger.success(f"⚑ Проверка завершена. Живых: {len(alive_nodes)}/{len(nodes)}")
-
-        if alive_nodes:
-            top_speed = await inspector.champion_run(alive_nodes)
-            alive_nodes.sort(key=lambda x: x.speed, reverse=True)
-            logger.info(f"⍟ Рекорд скорости: {top_speed} Mbps")
-            Exporter.save_files(alive_nodes)
-        else:
-            logger.warning("⚠ Нет рабочих прокси. Файлы подписок НЕ перезаписаны.")
+        history.record_run(checked_ids, alive_nodes, parser.metrics)
+        history.save()
+        report_duplicate_sources(scorer)
 
-        duration = time.perf_counter() - start_time
-        logger.info("Отправка Telegram отчета...")
-        
-        await Exporter.send_telegram_report(len(nodes), alive_nodes, duration, dead_sources)
-        logger.info(f"✔ Завершено за {duration:.2f} сек.")
+        await publish(inspector, len(nodes), alive_nodes, dead_sources, start_time, deadline=started + budget if budget else None)
+        checkpoint.clear()
         
     except Exception as e:
         logger.exception(f"Критический сбой в main(): {e}")
         sys.exit(1)
 
 
+async def merge(paths: List[str]):
+    start_time = time.perf_counter()
+    logger.info(f"⧉ Слияние {len(paths)} частичных результатов")
+
+    try:
+        total_parsed, checked_ids, alive_nodes, metrics, node_sources = load_partials(paths)
+        logger.success(f"⚑ Слияние завершено. Живых: {len(alive_nodes)}/{total_parsed}")
+
+        SourceScorer.annotate(metrics, node_sources, alive_nodes)
+        dead_sources = report_dead_sources(metrics)
+
+        history = RunHistory.load()
+        history.record_run(checked_ids, alive_nodes, metrics)
+        history.save()
+        report_duplicate_sources(SourceScorer(history))
+
+        await publish(Inspector(history), total_parsed, alive_nodes, dead_sources, start_time)
+
+    except Exception as e:
+        logger.exception(f"Критический сбой в merge(): {e}")
+        sys.exit(1)
+
+
+async def serve(host: Optional[str], port: Optional[int]):
+    logger.info("⏣ Запуск SunnyAreral в режиме демона")
+    await RKNValidator.load_lists()
+    await ServeDaemon(RunHistory.load()).run(host or CONFIG.serve.get("host", "0.0.0.0"), port or int(CONFIG.serve.get("port", 8080)))
+
+
+async def replay(path: str, speedup: float):
+    logger.info(f"▶ Реплей трассы без сети (×{speedup:g})")
+    await run_replay(path, speedup)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="SunnyAreral proxy checker")
+    ap.add_argument("--shard", help="проверить только шард i/N и записать частичный результат")
+    ap.add_argument("--out", help="путь частичного результата шарда (по умолчанию data/shard_<i>of<N>.json)")
+    ap.add_argument("--resume", action="store_true", help="продолжить прерванный прогон из журнала data/checkpoint*.jsonl")
+    ap.add_argument("--profile", action="store_true", help="записать спаны стадий/батчей и отчёт в data/profile_*")
+    ap.add_argument("--profile-sample", type=float, default=0.0, metavar="MS",
+                    help="дополнительно сэмплировать CPU event loop с интервалом MS (flamegraph в data/profile_cpu.folded)")
+    ap.add_argument("--record", nargs="?", const=TRACE_PATH, metavar="PATH",
+                    help=f"записать исходы проверки узлов для реплея (по умолчанию {TRACE_PATH})")
+    sub = ap.add_subparsers(dest="command")
+    merge_ap = sub.add_parser("merge", help="слить частичные результаты шардов и опубликовать")
+    merge_ap.add_argument("files", nargs="+")
+    serve_ap = sub.add_parser("serve", help="демон: узлы в памяти, скользящая перепроверка, раздача /sub по HTTP")
+    serve_ap.add_argument("--host")
+    serve_ap.add_argument("--port", type=int)
+    replay_ap = sub.add_parser("replay", help="прогнать записанную трассу через Inspector без сети")
+    replay_ap.add_argument("trace", nargs="?", default=TRACE_PATH)
+    replay_ap.add_argument("--speedup", type=float, default=20.0, help="во сколько раз ускорить модельное время")
+    args = ap.parse_args(argv)
+    if args.shard:
+        try:
+            parse_shard_spec(args.shard)
+        except ValueError as e:
+            ap.error(str(e))
+    return args
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
     if sys.platform == "win32":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     else:
@@ -72,10 +215,25 @@ if __name__ == "__main__":
         except ImportError:
             pass
 
+    if args.profile or args.profile_sample:
+        PROFILER.enable(args.profile_sample / 1000)
+    if args.record and args.command != "replay":
+        RECORDER.enable(args.record)
+
     try:
-        asyncio.run(main())
+        if args.command == "merge":
+            asyncio.run(merge(args.files))
+        elif args.command == "serve":
+            asyncio.run(serve(args.host, args.port))
+        elif args.command == "replay":
+            asyncio.run(replay(args.trace, args.speedup))
+        else:
+            asyncio.run(main(args.shard, args.out, args.resume))
     except KeyboardInterrupt:
         logger.warning("Остановка пользователем")
     except Exception as e:
         logger.critical(f"FATAL ERROR ВНЕ EVENT LOOP: {e}")
         sys.exit(1)
+    finally:
+        PROFILER.finish()
+        RECORDER.finish()